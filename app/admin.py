@@ -1,9 +1,30 @@
 from django.contrib import admin
-from app.models import Country, State, City, CustomUser
+from app.models import (
+    Country,
+    State,
+    City,
+    CustomUser,
+    ImportJob,
+    CountryDemographics,
+    StateDemographics,
+)
 
 # Register your models here.
 
+
+class HierarchyAdmin(admin.ModelAdmin):
+    """
+    Changelists print ``__str__`` per row, which reads the parent names
+    """
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_hierarchy()
+
+
 admin.site.register(CustomUser)
 admin.site.register(Country)
-admin.site.register(State)
-admin.site.register(City)
+admin.site.register(State, HierarchyAdmin)
+admin.site.register(City, HierarchyAdmin)
+admin.site.register(ImportJob)
+admin.site.register(CountryDemographics)
+admin.site.register(StateDemographics)
@@ -0,0 +1,72 @@
+"""
+City rankings per country or state, computed in a single query.
+
+Two ``ROW_NUMBER()`` windows partitioned by the group rank every city from
+both ends of the chosen metric; filtering on them keeps only the top-N and
+the minimum of each group, so the report costs one query however many
+countries or states there are.
+"""
+
+from collections import OrderedDict
+
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+# group: (partition field, group name field) of the flat city records
+GROUPS = {
+    "country": ("country_id", "country_name"),
+    "state": ("state_id", "state_name"),
+}
+METRICS = ["population", "avg_age"]
+MAX_TOP = 100
+
+
+def city_rankings(queryset, group, metric, top):
+    """
+    Return the min, max and top ``top`` cities by ``metric`` per group
+
+    ``queryset`` is a CityRecord queryset that limits the cities considered.
+    """
+    key, name = GROUPS[group]
+    partition = [F(key)]
+    rows = (
+        queryset.annotate(
+            rank_desc=Window(
+                RowNumber(),
+                partition_by=partition,
+                order_by=[F(metric).desc(), F("pk").asc()],
+            ),
+            rank_asc=Window(
+                RowNumber(),
+                partition_by=partition,
+                order_by=[F(metric).asc(), F("pk").asc()],
+            ),
+        )
+        .filter(Q(rank_desc__lte=top) | Q(rank_asc=1))
+        .values(
+            "id",
+            "name",
+            "city_code",
+            metric,
+            "rank_desc",
+            "rank_asc",
+            group_id=F(key),
+            group_name=F(name),
+        )
+        .order_by("group_name", "group_id", "rank_desc")
+    )
+
+    report = OrderedDict()
+    for row in rows:
+        entry = report.setdefault(
+            row["group_id"],
+            {"id": row["group_id"], "name": row["group_name"], "top": []},
+        )
+        city = {field: row[field] for field in ("id", "name", "city_code", metric)}
+        if row["rank_desc"] == 1:
+            entry["max"] = city
+        if row["rank_asc"] == 1:
+            entry["min"] = city
+        if row["rank_desc"] <= top:
+            entry["top"].append(city)
+    return list(report.values())
@@ -0,0 +1,98 @@
+"""
+JWT authentication without a query per request.
+
+``JWTAuthentication`` checks the token's signature and then loads the user
+with a SELECT on every request. ``CachedJWTAuthentication`` keeps both
+results in process-local LRU maps:
+
+- validated access tokens, keyed by a hash of the raw token, until the token
+  expires; revocations are still checked on every request (a set lookup, see
+  ``revocation.py``)
+- users, keyed by id, as the column values of the loaded row until any user
+  is saved or deleted. Every request gets its own instance built from them.
+  User writes bump a version shared through the cache backend, which empties
+  the maps of every process on their next lookup, so updated, deactivated and
+  deleted users are reloaded (and rejected) like before.
+
+Writes that skip the model signals, e.g. ``CustomUser.objects.update()``,
+must call ``invalidate()`` themselves.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import cache, revocation
+
+VERSION_KEY = "auth:users:version"
+
+
+class VersionedLRUCache(cache.LRUCache):
+    """
+    LRU map that empties itself when the shared version changes
+    """
+
+    def __init__(self, maxsize, version_key):
+        super().__init__(maxsize)
+        self.version_key = version_key
+        self.version = None
+
+    def current(self):
+        version = cache.get_version(self.version_key)
+        if version != self.version:
+            self.clear()
+            self.version = version
+        return self
+
+
+tokens = cache.LRUCache(getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 10_000))
+users = VersionedLRUCache(
+    getattr(settings, "AUTH_USER_CACHE_SIZE", 10_000), VERSION_KEY
+)
+
+
+def token_key(raw_token):
+    return hashlib.sha256(raw_token).hexdigest()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that reuses recently validated tokens and users
+    """
+
+    def get_validated_token(self, raw_token):
+        key = token_key(raw_token)
+        validated_token = tokens.get(key)
+        if validated_token is None or validated_token["exp"] <= time.time():
+            validated_token = super().get_validated_token(raw_token)
+            tokens.set(key, validated_token)
+        elif revocation.is_revoked(validated_token[api_settings.JTI_CLAIM]):
+            raise InvalidToken(_("Token is revoked"))
+        return validated_token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        current = users.current()
+        columns = [field.attname for field in self.user_model._meta.concrete_fields]
+        row = current.get(user_id)
+        if row is None:
+            user = super().get_user(validated_token)
+            values = [getattr(user, name) for name in columns]
+            current.set(user_id, (user._state.db, values))
+            return user
+        # A new instance per request, so requests never share model state
+        db, values = row
+        return self.user_model.from_db(db, columns, values)
+
+
+def invalidate():
+    """
+    Drop every process's cached users once the current transaction commits
+    """
+    transaction.on_commit(lambda: cache.bump_version(VERSION_KEY))
@@ -0,0 +1,321 @@
+"""
+In-memory prefix index for country, state and city name autocomplete.
+
+Names are folded to lower case without accents and indexed in sorted lists per
+owning user: the whole name in one list ("new york") and every later word in
+another ("york"), so a lookup is a binary search followed by a walk over at
+most ``limit`` hits. Results rank exact and whole-name matches before word
+matches, then alphabetically.
+
+The index is built on the first lookup and kept current by the write paths,
+which hand it their saved and deleted rows once the transaction commits, like
+the demographic rollups. Rows that add, rename, move or remove names bump a
+version of their own in the cache backend (``VERSION_KEY``); other writes
+leave it alone. A process adopts its own bump only when the version moved by
+exactly that one step. Any other change means another process indexed names,
+and the index is rebuilt in a background thread while the old one keeps
+serving. Replaced or deleted keys stay in the lists until enough of them pile
+up to compact; lookups skip them.
+"""
+
+import bisect
+import logging
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from . import cache
+from .models import Country, State, City
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "geo:autocomplete:version"
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Below this many new keys per list, insort; above, extend and re-sort
+INSORT_MAX = 64
+# Compact the lists once this fraction of their keys is stale
+GARBAGE_RATIO = 0.25
+
+KINDS = {Country: "country", State: "state", City: "city"}
+# Owner of a country, parent of a state or city
+REFERENCES = {Country: "my_user_id", State: "country_id", City: "state_id"}
+
+
+def fold(value):
+    """
+    Case- and accent-insensitive form of ``value``
+    """
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
+
+
+def word_keys(key):
+    """
+    Suffixes of ``key`` that start at its second and later words
+    """
+    return [key[index + 1 :] for index, char in enumerate(key) if char == " "]
+
+
+class Entry:
+    __slots__ = ("kind", "name", "key", "owner", "parent")
+
+    def __init__(self, kind, name, owner, parent):
+        self.kind = kind
+        self.name = name
+        self.key = fold(name)
+        self.owner = owner
+        self.parent = parent
+
+    def matches(self, key, owner):
+        if self.owner != owner:
+            return False
+        return key == self.key or (
+            self.key.endswith(key) and self.key[-len(key) - 1] == " "
+        )
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        # owner: sorted [(key, pk)], for whole names and for later words
+        self.names = defaultdict(list)
+        self.words = defaultdict(list)
+        self.garbage = 0
+        self.version = None
+        self.thread = None
+
+    @property
+    def built(self):
+        return self.version is not None
+
+    def build(self):
+        """
+        Load every name from the database and swap in the new lists
+        """
+        version = cache.get_version(VERSION_KEY)
+        entries = {}
+        owners = {}
+        for pk, name, owner in Country.objects.values_list("pk", "name", "my_user_id"):
+            entries[pk] = Entry("country", name, owner, None)
+            owners[pk] = owner
+        for pk, name, country in State.objects.values_list("pk", "name", "country_id"):
+            entries[pk] = Entry("state", name, owners.get(country), country)
+            owners[pk] = owners.get(country)
+        for pk, name, state in City.objects.values_list("pk", "name", "state_id"):
+            entries[pk] = Entry("city", name, owners.get(state), state)
+
+        names, words = defaultdict(list), defaultdict(list)
+        for pk, entry in entries.items():
+            names[entry.owner].append((entry.key, pk))
+            words[entry.owner].extend((key, pk) for key in word_keys(entry.key))
+        for lists in (names, words):
+            for keys in lists.values():
+                keys.sort()
+
+        with self.lock:
+            self.entries, self.names, self.words = entries, names, words
+            self.garbage = 0
+            self.version = version
+
+    def rebuild_in_background(self):
+        def run():
+            try:
+                self.build()
+            except Exception:
+                logger.exception("Rebuilding the autocomplete index failed")
+            finally:
+                connection.close()
+
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(
+                target=run, name="autocomplete-rebuild", daemon=True
+            )
+            self.thread.start()
+
+    def ensure_current(self):
+        """
+        Build the index on first use, rebuild it after foreign writes
+        """
+        if not self.built:
+            thread = self.thread
+            if thread is not None and thread.is_alive():
+                thread.join()
+            else:
+                self.build()
+        elif self.version != cache.get_version(VERSION_KEY):
+            self.rebuild_in_background()
+
+    def apply(self, rows, removed):
+        """
+        Index ``rows`` of ``(model, pk, name, reference)`` and drop ``removed``
+
+        Parents must be indexed before their children. Changes the index cannot
+        follow (a new owner, a missing parent) leave it stale for a rebuild.
+        Before the first build every call counts as a change.
+        """
+        if not self.built:
+            # The first build reads these rows itself
+            cache.bump_version(VERSION_KEY)
+            return
+        stale = changed = False
+        with self.lock:
+            new_names, new_words = defaultdict(list), defaultdict(list)
+            for model, pk, name, reference in rows:
+                if model is Country:
+                    owner, parent = reference, None
+                else:
+                    parent = reference
+                    parent_entry = self.entries.get(parent)
+                    owner = parent_entry.owner if parent_entry else None
+                    stale = stale or parent_entry is None
+                old = self.entries.get(pk)
+                # Children copied the old owner
+                stale = stale or (old is not None and old.owner != owner)
+                entry = Entry(KINDS[model], name, owner, parent)
+                self.entries[pk] = entry
+                if old is not None:
+                    if (old.key, old.owner) == (entry.key, entry.owner):
+                        changed = changed or old.parent != parent
+                        continue
+                    self.garbage += 1 + len(word_keys(old.key))
+                changed = True
+                new_names[owner].append((entry.key, pk))
+                new_words[owner].extend((key, pk) for key in word_keys(entry.key))
+            for pk in self.with_descendants(removed):
+                old = self.entries.pop(pk, None)
+                if old is not None:
+                    changed = True
+                    self.garbage += 1 + len(word_keys(old.key))
+
+            for lists, new in ((self.names, new_names), (self.words, new_words)):
+                for owner, keys in new.items():
+                    insert(lists[owner], sorted(keys))
+            total = sum(map(len, self.names.values()))
+            if self.garbage > total * GARBAGE_RATIO:
+                self.compact()
+            if changed or stale:
+                version = self.version
+                bumped = cache.bump_version(VERSION_KEY)
+                if stale or bumped is None or bumped != version + 1:
+                    self.version = -1
+                else:
+                    self.version = bumped
+
+    def with_descendants(self, pks):
+        """
+        ``pks`` with the states and cities under them, which the database
+        deletes along without signals
+        """
+        found = set(pks)
+        # Cities have no children, so deleting them needs no scan
+        parents = {
+            pk for pk in found if pk in self.entries and self.entries[pk].kind != "city"
+        }
+        while parents:
+            parents = {
+                pk
+                for pk, entry in self.entries.items()
+                if entry.parent in parents and pk not in found
+            }
+            found |= parents
+        return found
+
+    def compact(self):
+        for lists in (self.names, self.words):
+            for owner, keys in list(lists.items()):
+                lists[owner] = [
+                    (key, pk)
+                    for key, pk in keys
+                    if pk in self.entries and self.entries[pk].matches(key, owner)
+                ]
+        self.garbage = 0
+
+    def search(self, owner, prefix, limit=DEFAULT_LIMIT):
+        """
+        Up to ``limit`` entries of ``owner`` whose name or a word of it starts
+        with ``prefix``, as ``(pk, entry)`` pairs
+        """
+        prefix = fold(prefix)
+        found = {}
+        for keys in (self.names.get(owner, ()), self.words.get(owner, ())):
+            index = bisect.bisect_left(keys, (prefix,))
+            while len(found) < limit and index < len(keys):
+                key, pk = keys[index]
+                if not key.startswith(prefix):
+                    break
+                entry = self.entries.get(pk)
+                if entry is not None and entry.matches(key, owner):
+                    found.setdefault(pk, entry)
+                index += 1
+        return list(found.items())
+
+    def describe(self, pk, entry):
+        state = country = None
+        if entry.kind == "city":
+            state = self.entries.get(entry.parent)
+            country = self.entries.get(state.parent) if state else None
+        elif entry.kind == "state":
+            country = self.entries.get(entry.parent)
+        return {
+            "id": pk,
+            "type": entry.kind,
+            "name": entry.name,
+            "state": state.name if state else None,
+            "country": country.name if country else None,
+        }
+
+
+def insert(keys, new):
+    if len(new) <= INSORT_MAX:
+        for item in new:
+            bisect.insort(keys, item)
+    else:
+        # Timsort merges the two sorted runs in linear time
+        keys.extend(new)
+        keys.sort()
+
+
+index = PrefixIndex()
+
+
+def search(user, prefix, limit=DEFAULT_LIMIT):
+    """
+    Ranked autocomplete matches among ``user``'s countries, states and cities
+    """
+    index.ensure_current()
+    return [
+        index.describe(pk, entry) for pk, entry in index.search(user.pk, prefix, limit)
+    ]
+
+
+def add(instances):
+    """
+    Index saved countries, states or cities once the transaction commits
+    """
+    rows = [
+        (
+            type(instance),
+            instance.pk,
+            instance.name,
+            getattr(instance, REFERENCES[type(instance)]),
+        )
+        for instance in instances
+    ]
+    if rows:
+        transaction.on_commit(lambda: index.apply(rows, []))
+
+
+def remove(pks):
+    """
+    Drop deleted rows once the transaction commits
+    """
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: index.apply([], pks))
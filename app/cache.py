@@ -0,0 +1,102 @@
+"""
+Response cache for the geo read endpoints.
+
+Entries are keyed by user, full request URL and a data version. Any write
+to the geo models bumps the version (see ``signals.py`` and the bulk write
+paths), so stale entries are never read again and simply expire. A small
+in-process LRU sits in front of the shared Django cache backend; it is safe
+because every key embeds the version.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "geo:version"
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used mapping with a fixed size
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+local_cache = LRUCache(getattr(settings, "GEO_CACHE_LRU_SIZE", 256))
+
+
+def get_version(key=VERSION_KEY):
+    """
+    Current data version, shared by all processes through the cache backend
+    """
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a flushed cache never revives old entries
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key=VERSION_KEY):
+    """
+    Move the version on; returns the new one unless the key had to be reset
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+        return None
+
+
+def invalidate():
+    """
+    Bump the data version once the current transaction commits
+    """
+    transaction.on_commit(bump_version)
+
+
+def response_key(request):
+    user_id = request.user.pk if request.user.is_authenticated else None
+    url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f"geo:response:{get_version()}:{user_id}:{url}"
+
+
+def get_response(key):
+    data = local_cache.get(key)
+    if data is None:
+        data = cache.get(key)
+        if data is not None:
+            local_cache.set(key, data)
+    return data
+
+
+def set_response(key, data):
+    local_cache.set(key, data)
+    cache.set(key, data, getattr(settings, "GEO_CACHE_TIMEOUT", 300))
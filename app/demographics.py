@@ -0,0 +1,236 @@
+"""
+Per-state and per-country city rollups, maintained incrementally.
+
+Every city write becomes a delta row of ``(state_id, country_id, city_count,
+population, adult males, adult females)``. Deltas are summed per state and
+country and applied with one ``UPDATE ... SET population = population + CASE
+...`` statement per level, so bulk loads cost a constant number of queries
+however many cities they touch. ``manage.py rebuild_demographics`` recomputes
+the rollups from the City table.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, F, Sum, Value, When
+from django.db.models.functions import Now
+
+from .models import City, CountryDemographics, State, StateDemographics
+
+COUNTERS = ["city_count", "population", "num_of_adult_males", "num_of_adult_females"]
+
+# Keeps the CASE statements well below the database parameter limits
+UPDATE_BATCH_SIZE = 100
+
+
+def city_values(city, sign=1):
+    """
+    Delta row for adding (``sign=1``) or removing (``sign=-1``) a city
+
+    The country is left unresolved (``None``) unless the city's state is
+    already loaded.
+    """
+    country_id = city.state.country_id if City.state.is_cached(city) else None
+    return (
+        city.state_id,
+        country_id,
+        sign,
+        sign * city.population,
+        sign * city.num_of_adult_males,
+        sign * city.num_of_adult_females,
+    )
+
+
+def stored_cities_values(queryset):
+    """
+    Delta rows that remove the stored versions of the cities in ``queryset``
+    """
+    return [
+        (state_id, country_id, -1, *(-value for value in values))
+        for state_id, country_id, *values in queryset.values_list(
+            "state_id",
+            "state__country_id",
+            "population",
+            "num_of_adult_males",
+            "num_of_adult_females",
+        )
+    ]
+
+
+def stored_city_values(pk):
+    """
+    Delta row that removes the stored version of a city, or ``None``
+    """
+    rows = stored_cities_values(City.objects.filter(pk=pk))
+    return rows[0] if rows else None
+
+
+def empty_totals():
+    return [0] * len(COUNTERS)
+
+
+def add_totals(totals, values, sign=1):
+    for index, value in enumerate(values):
+        totals[index] += sign * value
+
+
+def increment(model, totals):
+    """
+    Add ``totals`` (``{pk: [counter deltas]}``) to existing rollup rows
+    """
+    from .ingest import chunked
+
+    totals = {pk: values for pk, values in totals.items() if any(values)}
+    for chunk in chunked(totals, UPDATE_BATCH_SIZE):
+        model.objects.filter(pk__in=chunk).update(
+            updated_at=Now(),
+            **{
+                field: F(field)
+                + Case(
+                    *[When(pk=pk, then=Value(totals[pk][index])) for pk in chunk],
+                    default=Value(0),
+                    output_field=BigIntegerField(),
+                )
+                for index, field in enumerate(COUNTERS)
+            },
+        )
+
+
+def ensure_rows(model, instances):
+    from .ingest import BATCH_SIZE
+
+    model.objects.bulk_create(instances, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def apply(deltas):
+    """
+    Add city delta rows to the state and country rollups
+    """
+    from .ingest import chunked
+
+    by_state = defaultdict(empty_totals)
+    countries = {}
+    for state_id, country_id, *values in deltas:
+        add_totals(by_state[state_id], values)
+        if country_id is not None:
+            countries[state_id] = country_id
+    missing = [state_id for state_id in by_state if state_id not in countries]
+    for chunk in chunked(missing):
+        countries.update(
+            State.objects.filter(pk__in=chunk).values_list("pk", "country_id")
+        )
+
+    by_state = {
+        state_id: values
+        for state_id, values in by_state.items()
+        if state_id in countries and any(values)
+    }
+    if not by_state:
+        return
+    by_country = defaultdict(empty_totals)
+    for state_id, values in by_state.items():
+        add_totals(by_country[countries[state_id]], values)
+
+    with transaction.atomic():
+        ensure_rows(
+            StateDemographics,
+            [
+                StateDemographics(state_id=state_id, country_id=countries[state_id])
+                for state_id in by_state
+            ],
+        )
+        ensure_rows(
+            CountryDemographics,
+            [CountryDemographics(country_id=country_id) for country_id in by_country],
+        )
+        increment(StateDemographics, by_state)
+        increment(CountryDemographics, by_country)
+
+
+def add_cities(cities):
+    """
+    Count newly inserted cities, e.g. after a bulk_create
+    """
+    apply([city_values(city) for city in cities])
+
+
+def stored_states(state_ids):
+    from .ingest import chunked
+
+    rows = []
+    for chunk in chunked(state_ids):
+        rows.extend(
+            StateDemographics.objects.filter(pk__in=chunk).values_list(
+                "pk", "country_id", *COUNTERS
+            )
+        )
+    return rows
+
+
+def move_states(moves):
+    """
+    Move state rollups to new countries; ``moves`` maps state to country ids
+    """
+    by_country = defaultdict(empty_totals)
+    moved = defaultdict(list)
+    for state_id, country_id, *values in stored_states(moves):
+        if country_id == moves[state_id]:
+            continue
+        add_totals(by_country[country_id], values, sign=-1)
+        add_totals(by_country[moves[state_id]], values)
+        moved[moves[state_id]].append(state_id)
+    if not moved:
+        return
+
+    with transaction.atomic():
+        ensure_rows(
+            CountryDemographics,
+            [CountryDemographics(country_id=country_id) for country_id in moved],
+        )
+        increment(CountryDemographics, by_country)
+        for country_id, state_ids in moved.items():
+            StateDemographics.objects.filter(pk__in=state_ids).update(
+                country_id=country_id
+            )
+
+
+def remove_states(state_ids):
+    """
+    Take the cities of states about to be deleted off their countries
+    """
+    by_country = defaultdict(empty_totals)
+    for _, country_id, *values in stored_states(state_ids):
+        add_totals(by_country[country_id], values, sign=-1)
+    increment(CountryDemographics, by_country)
+
+
+def rebuild():
+    """
+    Recompute every rollup from the City table
+    """
+    from .ingest import BATCH_SIZE
+
+    sums = {
+        "city_count": Count("pk"),
+        "population": Sum("population"),
+        "num_of_adult_males": Sum("num_of_adult_males"),
+        "num_of_adult_females": Sum("num_of_adult_females"),
+    }
+    states = [
+        StateDemographics(
+            state_id=row.pop("state_id"), country_id=row.pop("state__country_id"), **row
+        )
+        for row in City.objects.order_by()
+        .values("state_id", "state__country_id")
+        .annotate(**sums)
+    ]
+    countries = [
+        CountryDemographics(country_id=row.pop("state__country_id"), **row)
+        for row in City.objects.order_by().values("state__country_id").annotate(**sums)
+    ]
+    with transaction.atomic():
+        StateDemographics.objects.all().delete()
+        CountryDemographics.objects.all().delete()
+        StateDemographics.objects.bulk_create(states, batch_size=BATCH_SIZE)
+        CountryDemographics.objects.bulk_create(countries, batch_size=BATCH_SIZE)
+    return len(states), len(countries)
@@ -0,0 +1,115 @@
+"""
+Streaming CSV and JSON Lines export of countries, states and cities.
+
+Rows are read with ``QuerySet.iterator`` in fixed-size chunks and encoded one
+at a time, so memory stays flat whatever the table size. Parents are
+referenced by id and by their natural key (``country_code``, ``gst_code``),
+which makes the files loadable again with ``manage.py load_geo``.
+"""
+
+import csv
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Country, State, City
+
+CHUNK_SIZE = 2000
+FORMATS = ["csv", "jsonl"]
+
+# kind: (model, [(column, lookup)], lookup of the owning country)
+EXPORTS = {
+    "countries": (
+        Country,
+        [
+            ("id", "id"),
+            ("name", "name"),
+            ("country_code", "country_code"),
+            ("curr_symbol", "curr_symbol"),
+            ("phone_code", "phone_code"),
+            ("owner", "my_user__email"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+        ],
+        "",
+    ),
+    "states": (
+        State,
+        [
+            ("id", "id"),
+            ("name", "name"),
+            ("state_code", "state_code"),
+            ("gst_code", "gst_code"),
+            ("country", "country_id"),
+            ("country_code", "country__country_code"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+        ],
+        "country__",
+    ),
+    "cities": (
+        City,
+        [
+            ("id", "id"),
+            ("name", "name"),
+            ("city_code", "city_code"),
+            ("phone_code", "phone_code"),
+            ("population", "population"),
+            ("avg_age", "avg_age"),
+            ("num_of_adult_males", "num_of_adult_males"),
+            ("num_of_adult_females", "num_of_adult_females"),
+            ("state", "state_id"),
+            ("gst_code", "state__gst_code"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+        ],
+        "state__country__",
+    ),
+}
+
+
+class Echo:
+    """
+    File-like object whose ``write`` returns the value, for csv.writer
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(kind, user=None, country_code=None):
+    """
+    Return the header and a lazy iterator of value tuples for ``kind``
+    """
+    model, columns, country = EXPORTS[kind]
+    queryset = model.objects.order_by("pk")
+    if user is not None:
+        queryset = queryset.filter(**{f"{country}my_user": user})
+    if country_code is not None:
+        queryset = queryset.filter(**{f"{country}country_code": country_code})
+    rows = queryset.values_list(*[lookup for _, lookup in columns])
+    return [column for column, _ in columns], rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def encode_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(
+            [
+                value.isoformat() if hasattr(value, "isoformat") else value
+                for value in row
+            ]
+        )
+
+
+def encode_jsonl(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), cls=JSONEncoder) + "\n"
+
+
+def encode(fmt, header, rows):
+    """
+    Lazily encode rows as CSV (with a header line) or JSON Lines
+    """
+    return encode_csv(header, rows) if fmt == "csv" else encode_jsonl(header, rows)
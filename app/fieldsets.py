@@ -0,0 +1,64 @@
+"""
+``?fields=`` and ``?expand=`` handling for the geo read endpoints.
+
+Both parameters take comma separated, optionally dotted field paths::
+
+    ?fields=name,country_code          only these country fields
+    ?expand=states.cities              all fields, states with their cities
+    ?fields=name,states.name           country names with their state names
+
+A fieldset is a tree of ``{"fields": set or None, "expand": {name: node}}``
+nodes where ``fields=None`` means every plain field. Without either parameter
+there is no fieldset and responses keep the full nested shape; with one,
+nested relations are only included when asked for.
+"""
+
+
+def new_node():
+    return {"fields": None, "expand": {}}
+
+
+def split(value):
+    return [path.split(".") for path in (value or "").split(",") if path.strip()]
+
+
+def parse(fields=None, expand=None):
+    """
+    Build the fieldset tree from the raw query parameters, or ``None``
+    """
+    if not fields and not expand:
+        return None
+    root = new_node()
+    for parts in split(fields):
+        node = root
+        for name in parts[:-1]:
+            node["fields"] = (node["fields"] or set()) | {name.strip()}
+            node = node["expand"].setdefault(name.strip(), new_node())
+        node["fields"] = (node["fields"] or set()) | {parts[-1].strip()}
+    for parts in split(expand):
+        node = root
+        for name in parts:
+            node = node["expand"].setdefault(name.strip(), new_node())
+    return root
+
+
+def wants(fieldset, name, nested=False):
+    """
+    Whether the field ``name`` is part of the response
+    """
+    if fieldset is None:
+        return True
+    if fieldset["fields"] is not None and name in fieldset["fields"]:
+        return True
+    if nested:
+        return name in fieldset["expand"]
+    return fieldset["fields"] is None
+
+
+def child(fieldset, name):
+    """
+    Fieldset of the nested relation ``name``
+    """
+    if fieldset is None:
+        return None
+    return fieldset["expand"].get(name) or new_node()
@@ -0,0 +1,101 @@
+"""
+Declarative equality and range filters for the geo list endpoints.
+
+Views name their filterable query parameters in ``filter_fields``, mapped to
+the ORM path they filter on from ``filter_model`` (by default the model of
+the serializer)::
+
+    filter_fields = {"state": "state", "population": "population"}
+
+    ?state=<id>                          equality
+    ?population__gte=1000&population__lt=5000
+                                         ranges on non-relational fields
+
+Values are parsed with the model field's own ``to_python``, so a malformed
+value is a 400 rather than a database error. Every parameter a view accepts
+should be backed by an index that starts with it or with the equality field
+it is combined with (see ``City.Meta.indexes``).
+"""
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+RANGE_LOOKUPS = ("gt", "gte", "lt", "lte")
+
+
+def target_field(model, path):
+    """
+    Model field at the end of the ORM ``path`` from ``model``
+    """
+    *relations, name = path.split(LOOKUP_SEP)
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def filter_model(view):
+    """
+    Model whose fields the view's ``filter_fields`` paths start from
+    """
+    return getattr(view, "filter_model", None) or view.serializer_class.Meta.model
+
+
+def parse(query_params, model, filter_fields):
+    """
+    ``{orm lookup: value}`` for the ``filter_fields`` parameters present
+    """
+    lookups = {}
+    errors = {}
+    for param, raw in query_params.items():
+        name, _, lookup = param.partition(LOOKUP_SEP)
+        if name not in filter_fields:
+            continue
+        field = target_field(model, filter_fields[name])
+        if lookup and (lookup not in RANGE_LOOKUPS or field.is_relation):
+            continue
+        if field.is_relation:
+            field = field.target_field
+        try:
+            value = field.to_python(raw)
+        except DjangoValidationError as exc:
+            errors[param] = exc.messages
+            continue
+        suffix = f"{LOOKUP_SEP}{lookup}" if lookup else ""
+        lookups[f"{filter_fields[name]}{suffix}"] = value
+    if errors:
+        raise ValidationError(errors)
+    return lookups
+
+
+class RangeFilter(BaseFilterBackend):
+    """
+    Filter on the view's ``filter_fields``
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        filter_fields = getattr(view, "filter_fields", None)
+        if not filter_fields:
+            return queryset
+        lookups = parse(request.query_params, queryset.model, filter_fields)
+        return queryset.filter(**lookups) if lookups else queryset
+
+    def get_schema_operation_parameters(self, view):
+        model = filter_model(view)
+        parameters = []
+        for name, path in getattr(view, "filter_fields", {}).items():
+            field = target_field(model, path)
+            params = [name]
+            if not field.is_relation:
+                params += [f"{name}{LOOKUP_SEP}{lookup}" for lookup in RANGE_LOOKUPS]
+            parameters += [
+                {
+                    "name": param,
+                    "required": False,
+                    "in": "query",
+                    "schema": {"type": "string"},
+                }
+                for param in params
+            ]
+        return parameters
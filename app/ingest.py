@@ -0,0 +1,613 @@
+"""
+Set-based ingest for nested country -> states -> cities payloads.
+
+Rows are validated in memory, uniqueness is checked with one ``IN`` query per
+unique field and level, parents are resolved in batches and every level is
+written with ``bulk_create`` inside a single transaction.
+"""
+
+import uuid
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from . import autocomplete, cache, demographics, records, references
+from .models import Country, State, City
+from .serializers import CountrySerializer, StateSerializer, CitySerializer
+
+BATCH_SIZE = 500
+
+# (model, serializer, nested children key) per level, outermost first
+COUNTRY_LEVELS = [
+    (Country, CountrySerializer, "states"),
+    (State, StateSerializer, "cities"),
+    (City, CitySerializer, None),
+]
+STATE_LEVELS = COUNTRY_LEVELS[1:]
+
+
+def chunked(values, size=BATCH_SIZE):
+    """
+    Split an iterable into lists of at most ``size`` items
+    """
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def find_existing(model, field, values):
+    """
+    Return the subset of ``values`` already stored in ``model.field``
+    """
+    existing = set()
+    for chunk in chunked(set(values)):
+        existing.update(
+            model.objects.filter(**{f"{field}__in": chunk}).values_list(
+                field, flat=True
+            )
+        )
+    return existing
+
+
+def find_owners(model, field, values, key):
+    """
+    Return ``(value, key)`` pairs for stored rows whose ``field`` is in ``values``
+    """
+    owners = []
+    for chunk in chunked(set(values)):
+        owners.extend(
+            model.objects.filter(**{f"{field}__in": chunk}).values_list(field, key)
+        )
+    return owners
+
+
+def unique_message(model, field):
+    """
+    Error message for a duplicated unique value, e.g. "City code must be unique"
+    """
+    verbose_name = str(model._meta.get_field(field).verbose_name)
+    return f"{verbose_name.capitalize()} must be unique"
+
+
+def add_error(errors, index, field, message):
+    errors[index].setdefault(field, []).append(message)
+
+
+class GeoIngest:
+    """
+    Validate a whole geo payload in memory and insert it level by level
+    """
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        # Tells the serializers that uniqueness is checked for the whole batch
+        self.bulk_context = {**self.context, "bulk": True}
+
+    def row_serializer(self, serializer_class, parent_field):
+        """
+        Build a validation-only serializer without per-row database checks
+        """
+        serializer = serializer_class(context=self.bulk_context)
+        for name, field in list(serializer.fields.items()):
+            # Parents, by id or natural key, are resolved for the whole batch
+            # and nested children are split off and validated as their own level
+            if field.source == parent_field or isinstance(
+                field, serializers.BaseSerializer
+            ):
+                serializer.fields.pop(name)
+        serializer.validators = []
+        return serializer
+
+    def resolve_parents(self, model, rows, field, errors, queryset=None):
+        """
+        Resolve every row's parent, by ``row[field]`` or by the parent's
+        natural key, with at most one query per kind of key
+
+        Parents come from the cached maps in ``references.py`` unless a
+        ``queryset`` is given to load them in full.
+        """
+        natural_key = references.NATURAL_KEYS[model]
+        messages = {
+            **serializers.PrimaryKeyRelatedField.default_error_messages,
+            "does_not_exist_key": serializers.SlugRelatedField.default_error_messages[
+                "does_not_exist"
+            ],
+        }
+        keys = []
+        for index, row in enumerate(rows):
+            value = row.get(field) if isinstance(row, dict) else None
+            if value is None and isinstance(row, dict) and natural_key in row:
+                value = row[natural_key]
+                if isinstance(value, str):
+                    keys.append((natural_key, value))
+                    continue
+                add_error(
+                    errors,
+                    index,
+                    natural_key,
+                    messages["incorrect_type"].format(data_type=type(value).__name__),
+                )
+                keys.append(None)
+                continue
+            if value is None:
+                if isinstance(row, dict):
+                    add_error(errors, index, field, messages["required"])
+                keys.append(None)
+                continue
+            try:
+                keys.append(("pk", uuid.UUID(str(value))))
+            except ValueError:
+                add_error(
+                    errors,
+                    index,
+                    field,
+                    messages["incorrect_type"].format(data_type=type(value).__name__),
+                )
+                keys.append(None)
+
+        found = {}
+        for kind in ("pk", natural_key):
+            values = [key[1] for key in keys if key is not None and key[0] == kind]
+            found[kind] = (
+                references.resolve(model, kind, values, queryset) if values else {}
+            )
+
+        parents = []
+        for index, key in enumerate(keys):
+            parent = found[key[0]].get(key[1]) if key is not None else None
+            if key is not None and parent is None:
+                if key[0] == "pk":
+                    message = messages["does_not_exist"].format(pk_value=key[1])
+                    add_error(errors, index, field, message)
+                else:
+                    message = messages["does_not_exist_key"].format(
+                        slug_name=natural_key, value=key[1]
+                    )
+                    add_error(errors, index, natural_key, message)
+            parents.append(parent)
+        return parents
+
+    def validate_fields(self, serializer_class, rows, parent_field, parents):
+        """
+        Validate rows against the serializer fields only
+
+        Returns ``(validated, errors)`` aligned with ``rows``; validated data
+        is ``None`` for rows that failed validation.
+        """
+        serializer = self.row_serializer(serializer_class, parent_field)
+        validated = []
+        errors = [{} for _ in rows]
+        for index, (row, parent) in enumerate(zip(rows, parents)):
+            try:
+                validated_data = serializer.run_validation(row)
+            except serializers.ValidationError as exc:
+                detail = exc.detail
+                if not isinstance(detail, dict):
+                    detail = {api_settings.NON_FIELD_ERRORS_KEY: detail}
+                errors[index].update(detail)
+                validated.append(None)
+                continue
+            if parent_field:
+                validated_data[parent_field] = parent
+            validated.append(validated_data)
+        return validated, errors
+
+    def validate_rows(
+        self, model, serializer_class, rows, parent_field, parents, within_batch=True
+    ):
+        """
+        Validate rows and their uniqueness and return unsaved instances
+
+        Returns ``(instances, errors)`` aligned with ``rows``; the instance is
+        ``None`` for rows that failed field validation.
+        """
+        validated, errors = self.validate_fields(
+            serializer_class, rows, parent_field, parents
+        )
+        instances = [model(**data) if data is not None else None for data in validated]
+        self.check_unique(model, instances, errors, within_batch=within_batch)
+        return instances, errors
+
+    def check_unique(self, model, instances, errors, key=None, within_batch=True):
+        """
+        Check unique fields within the batch and against the database
+
+        With ``key``, stored rows with the same ``key`` value are the rows
+        being updated and do not count as conflicts. Without
+        ``within_batch``, rows repeating a value of an earlier row are not
+        errors and every row clashing with the database is.
+        """
+        unique_fields = [
+            field.name
+            for field in model._meta.fields
+            if field.unique and not field.primary_key
+        ]
+        for field in unique_fields:
+            seen = defaultdict(list)
+            for index, instance in enumerate(instances):
+                if instance is not None:
+                    seen[getattr(instance, field)].append(index)
+            if within_batch:
+                for indexes in seen.values():
+                    for index in indexes[1:]:
+                        add_error(errors, index, field, unique_message(model, field))
+            if key is None:
+                conflicts = find_existing(model, field, seen)
+            elif field == key:
+                conflicts = set()
+            else:
+                conflicts = {
+                    value
+                    for value, owner in find_owners(model, field, seen, key)
+                    if owner != getattr(instances[seen[value][0]], key)
+                }
+            for value in conflicts:
+                # Later rows with the value are already flagged as repeats
+                for index in seen[value][:1] if within_batch else seen[value]:
+                    add_error(errors, index, field, unique_message(model, field))
+
+        for together in model._meta.unique_together:
+            self.check_unique_together(
+                model, together, instances, errors, key, within_batch
+            )
+
+    def check_unique_together(
+        self, model, together, instances, errors, key=None, within_batch=True
+    ):
+        attnames = [model._meta.get_field(name).attname for name in together]
+        message = serializers.UniqueTogetherValidator.message.format(
+            field_names=", ".join(together)
+        )
+        seen = defaultdict(list)
+        for index, instance in enumerate(instances):
+            if instance is None:
+                continue
+            values = tuple(getattr(instance, attname) for attname in attnames)
+            if None not in values:
+                seen[values].append(index)
+        if within_batch:
+            for indexes in seen.values():
+                for index in indexes[1:]:
+                    add_error(errors, index, api_settings.NON_FIELD_ERRORS_KEY, message)
+        if not seen:
+            return
+
+        # New parents cannot have stored children yet, so only look up rows
+        # whose parents are already in the database
+        relations = [
+            name for name in together if model._meta.get_field(name).is_relation
+        ]
+        stored = [
+            values
+            for values, indexes in seen.items()
+            if not any(
+                getattr(instances[indexes[0]], name)._state.adding for name in relations
+            )
+        ]
+        for chunk in chunked(stored):
+            lookup = {
+                f"{attname}__in": {values[position] for values in chunk}
+                for position, attname in enumerate(attnames)
+            }
+            for row in model.objects.filter(**lookup).values_list(
+                *attnames, key or attnames[0]
+            ):
+                values, owner = row[:-1], row[-1]
+                if values not in seen:
+                    continue
+                indexes = seen[values]
+                if key is not None and owner == getattr(instances[indexes[0]], key):
+                    continue
+                for index in indexes[:1] if within_batch else indexes:
+                    add_error(errors, index, api_settings.NON_FIELD_ERRORS_KEY, message)
+
+    def upsert(self, model, serializer_class, rows, key, parent_model, parent_field):
+        """
+        Insert new rows and update changed ones, matching on the ``key`` field
+
+        Returns ``(instances, statuses)`` aligned with ``rows`` where the status
+        is "created", "updated" or "unchanged". Raises ValidationError with
+        per-row errors if any row is invalid.
+        """
+        errors = [{} for _ in rows]
+        parents = self.resolve_parents(parent_model, rows, parent_field, errors)
+        validated, field_errors = self.validate_fields(
+            serializer_class, rows, parent_field, parents
+        )
+        for error, field_error in zip(errors, field_errors):
+            error.update(field_error)
+        instances = [
+            model(**data) if data is not None and not error else None
+            for data, error in zip(validated, errors)
+        ]
+        self.check_unique(model, instances, errors, key=key)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        stored = {}
+        for chunk in chunked(getattr(instance, key) for instance in instances):
+            stored.update(model.objects.in_bulk(chunk, field_name=key))
+
+        with transaction.atomic():
+            new = [
+                instance
+                for instance in instances
+                if getattr(instance, key) not in stored
+            ]
+            if new:
+                self.insert_new(model, instances, new, key, stored)
+
+            now = timezone.now()
+            created, updated, changed_fields, statuses = [], [], {"updated_at"}, []
+            # bulk writes send no signals, so rollups are maintained here
+            city_deltas, state_moves = [], {}
+            for instance, data in zip(instances, validated):
+                current = stored.get(getattr(instance, key))
+                if current is None:
+                    created.append(instance)
+                    statuses.append("created")
+                    continue
+                # Compare foreign keys by attname so parents are never loaded
+                changed = [
+                    name
+                    for name in data
+                    if getattr(current, model._meta.get_field(name).attname)
+                    != getattr(instance, model._meta.get_field(name).attname)
+                ]
+                if changed and model is City:
+                    city_deltas.append(demographics.city_values(current, sign=-1))
+                for name in changed:
+                    setattr(current, name, data[name])
+                if changed and model is City:
+                    city_deltas.append(demographics.city_values(current))
+                if model is State and "country" in changed:
+                    state_moves[current.pk] = current.country_id
+                if changed:
+                    # bulk_update does not apply auto_now
+                    current.updated_at = now
+                    updated.append(current)
+                    changed_fields.update(changed)
+                statuses.append("updated" if changed else "unchanged")
+                instance.pk = current.pk
+
+            if updated:
+                model.objects.bulk_update(
+                    updated, sorted(changed_fields), batch_size=BATCH_SIZE
+                )
+            if model is City:
+                demographics.apply(
+                    city_deltas + [demographics.city_values(city) for city in created]
+                )
+                records.save_cities(created + updated)
+            if model is State:
+                records.update_states(state.pk for state in updated)
+            if state_moves:
+                demographics.move_states(state_moves)
+                references.invalidate()
+            cache.invalidate()
+            autocomplete.add(created + updated)
+        return instances, statuses
+
+    def insert_new(self, model, instances, new, key, stored):
+        """
+        Insert the ``new`` rows of an upsert that the lookup did not find
+
+        Rows inserted concurrently since the lookup are skipped by the insert
+        and added to ``stored``, so they are compared and updated like the rows
+        found before. Raises ValidationError if a row lost a race on another
+        unique field.
+        """
+        model.objects.bulk_create(new, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        found = {}
+        for chunk in chunked(getattr(instance, key) for instance in new):
+            found.update(model.objects.in_bulk(chunk, field_name=key))
+        if len(found) < len(new):
+            errors = [{} for _ in instances]
+            self.check_unique(model, instances, errors, key=key)
+            raise serializers.ValidationError(errors)
+        inserted = {instance.pk for instance in new}
+        stored.update(
+            (value, row) for value, row in found.items() if row.pk not in inserted
+        )
+
+    def validate_flat(self, model, serializer_class, rows, parent_model, field):
+        """
+        Validate flat rows that reference existing parents by primary key
+
+        Returns ``(validated, instances, errors)`` aligned with ``rows``.
+        """
+        errors = [{} for _ in rows]
+        parents = self.resolve_parents(parent_model, rows, field, errors)
+        validated, field_errors = self.validate_fields(
+            serializer_class, rows, field, parents
+        )
+        instances = [model(**data) if data is not None else None for data in validated]
+        self.check_unique(model, instances, field_errors)
+        for error, field_error in zip(errors, field_errors):
+            error.update(field_error)
+        return validated, instances, errors
+
+    def cities_chunk(self, rows):
+        """
+        Insert the valid rows of a flat city batch, skipping invalid ones
+
+        Returns ``(instances, errors)`` aligned with ``rows``; rows with errors
+        are not inserted.
+        """
+        _, instances, errors = self.validate_flat(
+            City, CitySerializer, rows, State, "state"
+        )
+        valid = [
+            instance
+            for instance, error in zip(instances, errors)
+            if instance is not None and not error
+        ]
+        with transaction.atomic():
+            City.objects.bulk_create(valid, batch_size=BATCH_SIZE)
+            demographics.add_cities(valid)
+            records.save_cities(valid)
+            cache.invalidate()
+            autocomplete.add(valid)
+        return instances, errors
+
+    def split_children(self, rows, field, errors):
+        """
+        Pop nested child lists off each row, returning them aligned with rows
+        """
+        children = []
+        for index, row in enumerate(rows):
+            value = row.pop(field, []) if isinstance(row, dict) else []
+            if not isinstance(value, list):
+                message = serializers.ListSerializer.default_error_messages[
+                    "not_a_list"
+                ].format(input_type=type(value).__name__)
+                add_error(errors, index, field, message)
+                value = []
+            children.append(value)
+        return children
+
+    def validate_tree(self, rows, levels, parents, parent_field, within_batch=True):
+        """
+        Recursively validate ``levels`` of nested rows
+
+        ``levels`` is a list of ``(model, serializer_class, children_key)``
+        tuples, outermost first. Returns the instances to insert per level and
+        the error tree aligned with ``rows``. ``within_batch`` is passed on to
+        ``check_unique``.
+        """
+        model, serializer_class, children_key = levels[0]
+        rows = [dict(row) if isinstance(row, dict) else row for row in rows]
+        pre_errors = [{} for _ in rows]
+        children = (
+            self.split_children(rows, children_key, pre_errors)
+            if children_key
+            else [[] for _ in rows]
+        )
+        instances, errors = self.validate_rows(
+            model, serializer_class, rows, parent_field, parents, within_batch
+        )
+        for error, pre_error in zip(errors, pre_errors):
+            error.update(pre_error)
+
+        created = [[instance for instance in instances if instance is not None]]
+        if children_key:
+            child_rows, child_parents, owners = [], [], []
+            for index, (instance, items) in enumerate(zip(instances, children)):
+                child_rows.extend(items)
+                child_parents.extend([instance] * len(items))
+                owners.extend([index] * len(items))
+            child_created, child_errors = self.validate_tree(
+                child_rows,
+                levels[1:],
+                child_parents,
+                model._meta.model_name,
+                within_batch,
+            )
+            created.extend(child_created)
+            nested = [[] for _ in rows]
+            for owner, error in zip(owners, child_errors):
+                nested[owner].append(error)
+            for error, items in zip(errors, nested):
+                if any(items):
+                    error[children_key] = items
+        return created, errors
+
+    def insert(self, levels, created):
+        """
+        Write every level with bulk_create inside a single transaction
+        """
+        with transaction.atomic():
+            for (model, _, _), instances in zip(levels, created):
+                model.objects.bulk_create(instances, batch_size=BATCH_SIZE)
+                if model is City:
+                    demographics.add_cities(instances)
+                    records.save_cities(instances)
+            cache.invalidate()  # bulk_create sends no save signals
+            for instances in created:
+                autocomplete.add(instances)
+
+    def ingest(self, rows, levels, parents, parent_field=None):
+        created, errors = self.validate_tree(rows, levels, parents, parent_field)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        self.insert(levels, created)
+        return created[0]
+
+    def ingest_valid(self, rows, levels, parents, parent_field=None):
+        """
+        Insert the rows of a batch that pass validation and skip the rest
+
+        Rows are kept as if inserted one by one: a row is skipped when it is
+        invalid on its own or repeats a unique value of an earlier kept row.
+        Returns ``(created, errors)`` with the inserted instances per level and
+        the errors aligned with ``rows``.
+        """
+        errors = [{} for _ in rows]
+
+        def validate(indexes, within_batch=True):
+            created, batch_errors = self.validate_tree(
+                [rows[index] for index in indexes],
+                levels,
+                [parents[index] for index in indexes],
+                parent_field,
+                within_batch,
+            )
+            for index, error in zip(indexes, batch_errors):
+                errors[index] = error
+            failed = [index for index, error in zip(indexes, batch_errors) if error]
+            return created, failed
+
+        # Errors that no other row of the batch causes stay whatever is dropped
+        _, failed = validate(range(len(rows)), within_batch=False)
+        failed = set(failed)
+        pending = [index for index in range(len(rows)) if index not in failed]
+        while True:
+            created, failed = validate(pending)
+            if not failed:
+                break
+            # Only repeats of earlier rows are left. The first failed row
+            # repeats a row that is kept; later ones may repeat a failed row
+            # and are validated again without it.
+            pending.remove(failed[0])
+        self.insert(levels, created)
+        return created, errors
+
+    def countries(self, rows, user):
+        """
+        Create countries with their nested states and cities
+        """
+        countries = self.ingest(rows, COUNTRY_LEVELS, [user] * len(rows), "my_user")
+        prefetch_related_objects(
+            countries,
+            Prefetch("states", queryset=State.objects.prefetch_related("cities")),
+        )
+        return CountrySerializer(countries, many=True, context=self.context).data
+
+    def states(self, rows):
+        """
+        Create states for existing countries with their nested cities
+        """
+        errors = [{} for _ in rows]
+        parents = self.resolve_parents(
+            Country,
+            rows,
+            "country",
+            errors,
+            queryset=Country.objects.select_related("my_user"),
+        )
+        # Rows whose country is missing must not reach the insert
+        created, tree_errors = self.validate_tree(
+            rows, STATE_LEVELS, parents, "country"
+        )
+        for error, detail in zip(errors, tree_errors):
+            error.update(detail)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        self.insert(STATE_LEVELS, created)
+        states = created[0]
+        prefetch_related_objects(states, "cities")
+        return StateSerializer(states, many=True, context=self.context).data
@@ -0,0 +1,149 @@
+"""
+Background bulk imports run by a local worker pool.
+
+Jobs are stored in the ImportJob table, so no external broker is needed:
+the web process hands job IDs to a small thread pool once the job row is
+committed, and ``manage.py run_import_jobs`` picks up anything left pending
+(for example after a restart).
+
+Each chunk commits together with the job's progress, and that progress save
+is the worker's heartbeat. A running job that has made no progress for
+``IMPORT_JOB_TIMEOUT`` seconds is taken to have lost its worker. It can then
+be claimed again and resumes at the first uncommitted chunk. A worker whose
+job was claimed by another one rolls back its chunk and stops.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .ingest import COUNTRY_LEVELS, GeoIngest
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+# Top-level rows validated and committed together
+JOB_CHUNK_SIZE = 50
+
+
+class JobLost(Exception):
+    """
+    Another worker claimed the job after this one went quiet
+    """
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "IMPORT_JOB_WORKERS", 2),
+                thread_name_prefix="import-job",
+            )
+    return _executor
+
+
+def enqueue(job):
+    """
+    Run the job in the worker pool once the current transaction commits
+    """
+    transaction.on_commit(lambda: get_executor().submit(run_job, job.pk))
+
+
+def claimable_jobs():
+    """
+    Jobs that are pending, or running without progress for the timeout
+    """
+    timeout = timedelta(seconds=getattr(settings, "IMPORT_JOB_TIMEOUT", 600))
+    return ImportJob.objects.filter(
+        Q(status=ImportJob.Status.PENDING)
+        | Q(status=ImportJob.Status.RUNNING, updated_at__lt=timezone.now() - timeout)
+    )
+
+
+def run_job(job_id):
+    """
+    Claim a pending or abandoned job and import its payload chunk by chunk
+    """
+    try:
+        now = timezone.now()
+        claimed = (
+            claimable_jobs()
+            .filter(pk=job_id)
+            .update(
+                status=ImportJob.Status.RUNNING,
+                started_at=Coalesce("started_at", now),
+                updated_at=now,
+            )
+        )
+        if not claimed:
+            return
+        job = ImportJob.objects.select_related("my_user").get(pk=job_id)
+        process_countries(job)
+    except JobLost:
+        logger.warning("Import job %s was claimed by another worker", job_id)
+    except Exception as exc:
+        logger.exception("Import job %s failed", job_id)
+        ImportJob.objects.filter(pk=job_id).update(
+            status=ImportJob.Status.FAILED,
+            errors={"detail": str(exc)},
+            finished_at=timezone.now(),
+        )
+    finally:
+        # Worker threads own their connections
+        connections.close_all()
+
+
+def process_countries(job):
+    """
+    Import nested countries from ``job.processed_rows`` on, committing valid
+    rows and the progress chunk by chunk
+    """
+    rows = job.payload or []
+    ingest = GeoIngest()
+    counts = {"countries": 0, "states": 0, "cities": 0, **job.created_counts}
+    for offset in range(job.processed_rows, len(rows), JOB_CHUNK_SIZE):
+        chunk = rows[offset : offset + JOB_CHUNK_SIZE]
+        with transaction.atomic():
+            created, errors = ingest.ingest_valid(
+                chunk, COUNTRY_LEVELS, [job.my_user] * len(chunk), "my_user"
+            )
+            for key, instances in zip(counts, created):
+                counts[key] += len(instances)
+            for index, error in enumerate(errors, start=offset):
+                if error:
+                    job.errors[str(index)] = error
+                    job.failed_rows += 1
+
+            job.processed_rows = offset + len(chunk)
+            job.created_counts = counts
+            # Only while this worker still owns the job, i.e. nobody else has
+            # committed progress since
+            saved = ImportJob.objects.filter(
+                pk=job.pk, status=ImportJob.Status.RUNNING, processed_rows=offset
+            ).update(
+                processed_rows=job.processed_rows,
+                failed_rows=job.failed_rows,
+                created_counts=counts,
+                errors=job.errors,
+                updated_at=timezone.now(),
+            )
+            if not saved:
+                raise JobLost(job.pk)
+
+    job.status = ImportJob.Status.COMPLETED
+    job.created_counts = counts
+    job.payload = None  # No longer needed once imported
+    job.finished_at = timezone.now()
+    job.save()
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from app.export import EXPORTS, FORMATS, encode, export_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream all countries, states or cities to a CSV or JSON Lines file. "
+        "The output can be loaded again with load_geo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--country-code", help="Only export this country")
+        parser.add_argument("--output", help="File to write (defaults to stdout)")
+
+    def handle(self, *args, **options):
+        header, rows = export_rows(
+            options["kind"], country_code=options["country_code"]
+        )
+        output = options["output"]
+        handle = (
+            open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+        )
+        count = 0
+        try:
+            for line in encode(options["format"], header, rows):
+                handle.write(line)
+                count += 1
+        finally:
+            if output:
+                handle.close()
+        if output:
+            rows_written = count - 1 if options["format"] == "csv" else count
+            self.stderr.write(
+                self.style.SUCCESS(f"Exported {rows_written} {options['kind']}")
+            )
@@ -0,0 +1,272 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.settings import api_settings
+
+from app import autocomplete, cache, demographics, records
+from app.ingest import GeoIngest, chunked
+from app.models import Country, State, City, CustomUser
+from app.serializers import CountrySerializer, StateSerializer, CitySerializer
+
+# kind: (model, serializer, natural key, parent model, parent key, parent field)
+KINDS = {
+    "countries": (Country, CountrySerializer, "country_code", None, None, None),
+    "states": (State, StateSerializer, "gst_code", Country, "country_code", "country"),
+    "cities": (City, CitySerializer, "city_code", State, "gst_code", "state"),
+}
+
+
+def read_records(path, fmt):
+    """
+    Yield ``(line_number, record)`` for every data row of a CSV or JSONL dump
+
+    CSV records are dicts keyed by the header, JSONL records are raw lines
+    that are decoded by the parse workers.
+    """
+    with open(path, newline="", encoding="utf-8") as handle:
+        if fmt == "csv":
+            reader = csv.DictReader(handle)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if line.strip():
+                    yield line_number, line
+
+
+def parse_chunk(kind, fmt, records):
+    """
+    Decode and validate a chunk of records without touching the database
+
+    Runs in the worker processes. Returns ``(line_number, data, parent_key,
+    errors)`` tuples.
+    """
+    _, serializer_class, _, _, parent_key, parent_field = KINDS[kind]
+    rows, parsed = [], []
+    for line_number, record in records:
+        if fmt == "csv":
+            row = {key: value for key, value in record.items() if value != ""}
+        else:
+            try:
+                row = json.loads(record)
+            except ValueError as exc:
+                error = {
+                    api_settings.NON_FIELD_ERRORS_KEY: [f"JSON parse error - {exc}"]
+                }
+                parsed.append((line_number, None, None, error))
+                continue
+        rows.append((line_number, row))
+
+    validated, errors = GeoIngest().validate_fields(
+        serializer_class,
+        [row for _, row in rows],
+        parent_field,
+        [None] * len(rows),
+    )
+    for (line_number, row), data, error in zip(rows, validated, errors):
+        key = row.get(parent_key) if parent_key and isinstance(row, dict) else None
+        if data is not None:
+            data.pop(parent_field, None)
+            if parent_key and key is None:
+                error = {parent_key: ["This field is required."]}
+        parsed.append((line_number, None if error else data, key, error or None))
+    return sorted(parsed)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import countries, states or cities from a CSV or JSON Lines dump. "
+        "States reference their country by country_code and cities their "
+        "state by gst_code. Interrupted imports resume from the checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(KINDS))
+        parser.add_argument("path", help="CSV (with header) or .jsonl file")
+        parser.add_argument(
+            "--format", choices=["csv", "jsonl"], help="Defaults to the extension"
+        )
+        parser.add_argument(
+            "--owner", help="Email of the user owning imported countries"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per parse chunk and insert transaction",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Parse processes; 0 parses in the main process",
+        )
+        parser.add_argument(
+            "--checkpoint", help="Checkpoint file (defaults to <path>.checkpoint)"
+        )
+        parser.add_argument(
+            "--restart", action="store_true", help="Ignore an existing checkpoint"
+        )
+
+    def handle(self, *args, **options):
+        kind, path = options["kind"], os.path.abspath(options["path"])
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "jsonl")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        owner = None
+        if kind == "countries":
+            if not options["owner"]:
+                raise CommandError("--owner is required when importing countries")
+            owner = CustomUser.objects.filter(email=options["owner"]).first()
+            if owner is None:
+                raise CommandError(f"User {options['owner']} not found")
+
+        checkpoint_path = options["checkpoint"] or f"{path}.checkpoint"
+        done = (
+            0
+            if options["restart"]
+            else self.read_checkpoint(checkpoint_path, path, kind)
+        )
+        if done:
+            self.stdout.write(f"Resuming after {done} rows")
+
+        records = islice(read_records(path, fmt), done, None)
+        chunks = (
+            (kind, fmt, chunk)
+            for chunk in iter(lambda: list(islice(records, options["batch_size"])), [])
+        )
+
+        totals = {"created": 0, "skipped": 0, "failed": 0}
+        started = time.monotonic()
+        for parsed in self.parse(chunks, options["workers"]):
+            self.load_chunk(kind, parsed, owner, totals)
+            done += len(parsed)
+            self.write_checkpoint(checkpoint_path, path, kind, done)
+            elapsed = time.monotonic() - started
+            processed = sum(totals.values())
+            self.stdout.write(
+                f"{done} rows ({processed / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - started
+        processed = sum(totals.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {totals['created']}, skipped {totals['skipped']} existing, "
+                f"failed {totals['failed']} in {elapsed:.1f}s "
+                f"({processed / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        )
+
+    def parse(self, chunks, workers):
+        """
+        Parse chunks in a process pool, yielding results in file order
+        """
+        if workers < 1:
+            for chunk in chunks:
+                yield parse_chunk(*chunk)
+            return
+
+        # Keep a bounded window of chunks in flight so memory stays flat
+        with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(parse_chunk, *chunk))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def load_chunk(self, kind, parsed, owner, totals):
+        """
+        Resolve parents, skip rows already loaded and bulk insert the rest
+        """
+        model, _, natural_key, parent_model, parent_key, parent_field = KINDS[kind]
+        ingest = GeoIngest()
+
+        parents = {}
+        if parent_model is not None:
+            keys = {key for _, data, key, _ in parsed if data is not None}
+            for chunk in chunked(keys):
+                parents.update(
+                    parent_model.objects.filter(**{f"{parent_key}__in": chunk}).in_bulk(
+                        field_name=parent_key
+                    )
+                )
+
+        natural_keys = {data[natural_key] for _, data, _, _ in parsed if data}
+        existing = set()
+        for chunk in chunked(natural_keys):
+            existing.update(
+                model.objects.filter(**{f"{natural_key}__in": chunk}).values_list(
+                    natural_key, flat=True
+                )
+            )
+
+        lines, instances, errors = [], [], []
+        for line_number, data, key, error in parsed:
+            if data is not None and data[natural_key] in existing:
+                # Already loaded, e.g. by a run interrupted before its checkpoint
+                totals["skipped"] += 1
+                continue
+            if data is not None:
+                if parent_model is None:
+                    data["my_user"] = owner
+                elif key in parents:
+                    data[parent_field] = parents[key]
+                else:
+                    error = {parent_key: [f'"{key}" does not exist.']}
+            lines.append(line_number)
+            instances.append(model(**data) if not error else None)
+            errors.append(error or {})
+
+        ingest.check_unique(model, instances, errors)
+        valid = [
+            instance
+            for instance, error in zip(instances, errors)
+            if instance is not None and not error
+        ]
+        with transaction.atomic():
+            model.objects.bulk_create(valid, batch_size=1000)
+            if model is City:
+                demographics.add_cities(valid)
+                records.save_cities(valid)
+            cache.invalidate()
+            autocomplete.add(valid)
+
+        totals["created"] += len(valid)
+        for line_number, error in zip(lines, errors):
+            if error:
+                totals["failed"] += 1
+                self.stderr.write(f"line {line_number}: {json.dumps(error)}")
+
+    def read_checkpoint(self, checkpoint_path, path, kind):
+        if not os.path.exists(checkpoint_path):
+            return 0
+        with open(checkpoint_path) as handle:
+            checkpoint = json.load(handle)
+        if checkpoint.get("path") != path or checkpoint.get("kind") != kind:
+            raise CommandError(
+                f"{checkpoint_path} belongs to another import, use --restart"
+            )
+        return checkpoint["rows"]
+
+    def write_checkpoint(self, checkpoint_path, path, kind, rows):
+        # Write then rename so an interrupted write never corrupts the file
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, "w") as handle:
+            json.dump({"path": path, "kind": kind, "rows": rows}, handle)
+        os.replace(tmp_path, checkpoint_path)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app import records
+
+
+class Command(BaseCommand):
+    help = (
+        "Recreate the flat city records from the City, State and Country "
+        "tables, e.g. after raw SQL edits or restoring a backup."
+    )
+
+    def handle(self, *args, **options):
+        total = records.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} city records"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app import demographics
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-state and per-country city rollups from the City "
+        "table, e.g. after raw SQL edits or restoring a backup."
+    )
+
+    def handle(self, *args, **options):
+        states, countries = demographics.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt demographics of {states} states and {countries} countries"
+            )
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from app.jobs import claimable_jobs, run_job
+from app.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run import jobs left pending, or abandoned while running, e.g. after "
+        "the web process restarted."
+    )
+
+    def handle(self, *args, **options):
+        jobs = claimable_jobs().order_by("created_at")
+        job_ids = list(jobs.values_list("id", flat=True))
+        for job_id in job_ids:
+            run_job(job_id)
+            job = ImportJob.objects.get(pk=job_id)
+            self.stdout.write(
+                f"{job_id}: {job.status}, {job.processed_rows}/{job.total_rows} rows, "
+                f"{job.failed_rows} failed"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Ran {len(job_ids)} pending or abandoned jobs")
+        )
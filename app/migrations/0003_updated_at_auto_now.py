@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0002_importjob"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="city",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name="country",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name="state",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
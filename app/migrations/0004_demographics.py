@@ -0,0 +1,93 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_demographics(apps, schema_editor):
+    City = apps.get_model("app", "City")
+    StateDemographics = apps.get_model("app", "StateDemographics")
+    CountryDemographics = apps.get_model("app", "CountryDemographics")
+    sums = {
+        "city_count": models.Count("pk"),
+        "population": models.Sum("population"),
+        "num_of_adult_males": models.Sum("num_of_adult_males"),
+        "num_of_adult_females": models.Sum("num_of_adult_females"),
+    }
+    StateDemographics.objects.bulk_create(
+        StateDemographics(
+            state_id=row.pop("state_id"), country_id=row.pop("state__country_id"), **row
+        )
+        for row in City.objects.order_by()
+        .values("state_id", "state__country_id")
+        .annotate(**sums)
+    )
+    CountryDemographics.objects.bulk_create(
+        CountryDemographics(country_id=row.pop("state__country_id"), **row)
+        for row in City.objects.order_by().values("state__country_id").annotate(**sums)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0003_updated_at_auto_now"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CountryDemographics",
+            fields=[
+                ("city_count", models.IntegerField(default=0)),
+                ("population", models.BigIntegerField(default=0)),
+                ("num_of_adult_males", models.BigIntegerField(default=0)),
+                ("num_of_adult_females", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "country",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="demographics",
+                        serialize=False,
+                        to="app.country",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="StateDemographics",
+            fields=[
+                ("city_count", models.IntegerField(default=0)),
+                ("population", models.BigIntegerField(default=0)),
+                ("num_of_adult_males", models.BigIntegerField(default=0)),
+                ("num_of_adult_females", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "state",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="demographics",
+                        serialize=False,
+                        to="app.state",
+                    ),
+                ),
+                (
+                    "country",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="state_demographics",
+                        to="app.country",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(build_demographics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0004_demographics"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(fields=["name", "id"], name="city_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="country",
+            index=models.Index(
+                fields=["my_user", "name", "id"], name="country_user_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="state",
+            index=models.Index(fields=["name", "id"], name="state_name_idx"),
+        ),
+    ]
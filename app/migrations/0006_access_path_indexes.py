@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0005_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(
+                fields=["state", "name", "id"], name="city_state_name_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="city",
+            name="state",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="cities",
+                to="app.state",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="country",
+            name="my_user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="state",
+            name="country",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="states",
+                to="app.country",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0006_access_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(
+                fields=["state", "population"], name="city_state_pop_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(
+                fields=["state", "avg_age"], name="city_state_avg_age_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(fields=["population"], name="city_population_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(fields=["avg_age"], name="city_avg_age_idx"),
+        ),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_city_records(apps, schema_editor):
+    City = apps.get_model("app", "City")
+    CityRecord = apps.get_model("app", "CityRecord")
+    columns = [field.attname for field in City._meta.concrete_fields]
+    parents = {
+        "state_name": models.F("state__name"),
+        "gst_code": models.F("state__gst_code"),
+        "country_id": models.F("state__country_id"),
+        "country_name": models.F("state__country__name"),
+        "country_code": models.F("state__country__country_code"),
+        "owner_id": models.F("state__country__my_user_id"),
+    }
+    CityRecord.objects.bulk_create(
+        (CityRecord(**row) for row in City.objects.values(*columns, **parents)),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0007_city_range_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CityRecord",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("city_code", models.CharField(max_length=10)),
+                ("phone_code", models.CharField(max_length=10)),
+                ("population", models.IntegerField()),
+                ("avg_age", models.FloatField()),
+                ("num_of_adult_males", models.IntegerField()),
+                ("num_of_adult_females", models.IntegerField()),
+                ("state_name", models.CharField(max_length=100)),
+                ("gst_code", models.CharField(max_length=15)),
+                ("country_name", models.CharField(max_length=100)),
+                ("country_code", models.CharField(max_length=3)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name="city",
+            name="city_state_pop_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="city",
+            name="city_state_avg_age_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="city",
+            name="city_population_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="city",
+            name="city_avg_age_idx",
+        ),
+        migrations.AddField(
+            model_name="cityrecord",
+            name="country",
+            field=models.ForeignKey(
+                db_constraint=False,
+                db_index=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="app.country",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cityrecord",
+            name="owner",
+            field=models.ForeignKey(
+                db_constraint=False,
+                db_index=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="cityrecord",
+            name="state",
+            field=models.ForeignKey(
+                db_constraint=False,
+                db_index=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="app.state",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(fields=["name", "id"], name="record_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(
+                fields=["state", "name", "id"], name="record_state_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(
+                fields=["country", "name", "id"], name="record_country_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(
+                fields=["owner", "country", "state"], name="record_owner_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(
+                fields=["state", "population"], name="record_state_pop_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(
+                fields=["state", "avg_age"], name="record_state_age_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(fields=["population"], name="record_population_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cityrecord",
+            index=models.Index(fields=["avg_age"], name="record_avg_age_idx"),
+        ),
+        migrations.RunPython(build_city_records, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+import functools
 from uuid import uuid4
 from django.db import models
 from django.core.exceptions import ValidationError
@@ -64,43 +65,105 @@ class Country(models.Model):
     country_code = models.CharField(max_length=3, unique=True)
     curr_symbol = models.CharField(max_length=5)
     phone_code = models.CharField(max_length=10, unique=True)
-    my_user = models.ForeignKey("CustomUser", on_delete=models.CASCADE)
+    # Indexed by country_user_name_idx
+    my_user = models.ForeignKey("CustomUser", on_delete=models.CASCADE, db_index=False)
 
     # Meta Fields
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pages of the owner's countries (see ModelPagination)
+            models.Index(
+                fields=["my_user", "name", "id"], name="country_user_name_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
 
+def from_hierarchy(instance, relation, annotation, load):
+    """
+    The ``with_hierarchy()`` annotation of ``instance``, or ``load()`` when it
+    was not annotated or ``relation`` is loaded (and possibly reassigned)
+    """
+    field = instance._meta.get_field(relation)
+    if annotation in instance.__dict__ and not field.is_cached(instance):
+        return instance.__dict__[annotation]
+    return load()
+
+
+class StateQuerySet(models.QuerySet):
+    def with_hierarchy(self):
+        """
+        Annotate what ``country_name``, ``country_user_name`` and ``__str__``
+        read, so they need no query per state
+        """
+        return self.annotate(
+            _country_name=models.F("country__name"),
+            _country_user_name=models.F("country__my_user__email"),
+        )
+
+
 # State Model
 class State(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     name = models.CharField(max_length=100)
     state_code = models.CharField(max_length=10)
     gst_code = models.CharField(max_length=15, unique=True)
+    # Indexed by the (country, name) unique constraint
     country = models.ForeignKey(
-        Country, on_delete=models.CASCADE, related_name="states"
+        Country, on_delete=models.CASCADE, related_name="states", db_index=False
     )
 
     # Meta Fields
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StateQuerySet.as_manager()
 
     class Meta:
         unique_together = ("country", "name")
+        indexes = [
+            models.Index(fields=["name", "id"], name="state_name_idx"),
+        ]
 
     @property
     def country_name(self):
-        return self.country.name
+        return from_hierarchy(
+            self, "country", "_country_name", lambda: self.country.name
+        )
 
     @property
     def country_user_name(self):
-        return self.country.my_user.email if self.country.my_user else None
+        return from_hierarchy(
+            self,
+            "country",
+            "_country_user_name",
+            lambda: self.country.my_user.email if self.country.my_user else None,
+        )
 
     def __str__(self) -> str:
-        return f"{self.name} - {self.country.name}"
+        return f"{self.name} - {self.country_name}"
+
+
+class CityQuerySet(models.QuerySet):
+    def with_hierarchy(self):
+        """
+        Annotate what ``state_name``, ``country_name`` and ``__str__`` read,
+        so they need no query per city
+        """
+        return self.annotate(
+            _state_name=models.F("state__name"),
+            _country_name=models.F("state__country__name"),
+        )
+
+    def delete(self):
+        from .signals import delete_cities
+
+        return delete_cities(self, super().delete)
 
 
 # City Model
@@ -113,15 +176,41 @@ class City(models.Model):
     avg_age = models.FloatField()
     num_of_adult_males = models.IntegerField()
     num_of_adult_females = models.IntegerField()
-    state = models.ForeignKey(State, on_delete=models.CASCADE, related_name="cities")
+    # Indexed by city_state_name_idx
+    state = models.ForeignKey(
+        State, on_delete=models.CASCADE, related_name="cities", db_index=False
+    )
 
     # Meta Fields
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CityQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "id"], name="city_name_idx"),
+            models.Index(fields=["state", "name", "id"], name="city_state_name_idx"),
+        ]
 
     @property
     def state_name(self):
-        return self.state.name
+        return from_hierarchy(self, "state", "_state_name", lambda: self.state.name)
+
+    @property
+    def country_name(self):
+        return from_hierarchy(
+            self, "state", "_country_name", lambda: self.state.country_name
+        )
+
+    def delete(self, using=None, keep_parents=False):
+        from .signals import delete_cities
+
+        # Cities send no delete signals, see signals.py
+        return delete_cities(
+            City.objects.using(using).filter(pk=self.pk),
+            functools.partial(super().delete, using, keep_parents),
+        )
 
     def clean(self):
         # Custom validation to ensure population > sum of adult males and females
@@ -131,4 +220,154 @@ class City(models.Model):
             )
 
     def __str__(self) -> str:
-        return f"{self.name} - {self.state.name}"
+        return f"{self.name} - {self.state_name}"
+
+
+# Import Job Model
+class ImportJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        RUNNING = "running", _("Running")
+        COMPLETED = "completed", _("Completed")
+        FAILED = "failed", _("Failed")
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    my_user = models.ForeignKey("CustomUser", on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    payload = models.JSONField(null=True)
+    total_rows = models.IntegerField(default=0)
+    processed_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    created_counts = models.JSONField(default=dict)
+    errors = models.JSONField(default=dict)
+
+    # Meta Fields
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.id} ({self.status})"
+
+
+# Demographic Rollups
+class Demographics(models.Model):
+    city_count = models.IntegerField(default=0)
+    population = models.BigIntegerField(default=0)
+    num_of_adult_males = models.BigIntegerField(default=0)
+    num_of_adult_females = models.BigIntegerField(default=0)
+
+    # Meta Fields
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class StateDemographics(Demographics):
+    state = models.OneToOneField(
+        State, on_delete=models.CASCADE, primary_key=True, related_name="demographics"
+    )
+    country = models.ForeignKey(
+        Country, on_delete=models.CASCADE, related_name="state_demographics"
+    )
+
+    def __str__(self) -> str:
+        return f"Demographics of {self.state_id}"
+
+
+class CountryDemographics(Demographics):
+    country = models.OneToOneField(
+        Country, on_delete=models.CASCADE, primary_key=True, related_name="demographics"
+    )
+
+    def __str__(self) -> str:
+        return f"Demographics of {self.country_id}"
+
+
+# Flat city read model
+class CityRecord(models.Model):
+    """
+    A city with the names and codes of its state and country and the owner's
+    id, so city lists and reports read one table without joins
+
+    Kept in sync by the write paths through ``app/records.py``.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    name = models.CharField(max_length=100)
+    city_code = models.CharField(max_length=10)
+    phone_code = models.CharField(max_length=10)
+    population = models.IntegerField()
+    avg_age = models.FloatField()
+    num_of_adult_males = models.IntegerField()
+    num_of_adult_females = models.IntegerField()
+    # Copies of the parents' columns; records are removed with their parents
+    state = models.ForeignKey(
+        State,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+    )
+    state_name = models.CharField(max_length=100)
+    gst_code = models.CharField(max_length=15)
+    country = models.ForeignKey(
+        Country,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+    )
+    country_name = models.CharField(max_length=100)
+    country_code = models.CharField(max_length=3)
+    owner = models.ForeignKey(
+        "CustomUser",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+    )
+
+    # The city's Meta Fields
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "id"], name="record_name_idx"),
+            models.Index(fields=["state", "name", "id"], name="record_state_name_idx"),
+            models.Index(
+                fields=["country", "name", "id"], name="record_country_name_idx"
+            ),
+            models.Index(fields=["owner", "country", "state"], name="record_owner_idx"),
+            # Range filters of the city list, within a state or over all cities
+            models.Index(fields=["state", "population"], name="record_state_pop_idx"),
+            models.Index(fields=["state", "avg_age"], name="record_state_age_idx"),
+            models.Index(fields=["population"], name="record_population_idx"),
+            models.Index(fields=["avg_age"], name="record_avg_age_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} - {self.state_name}"
+
+
+# Revoked JWT Model
+class RevokedToken(models.Model):
+    """
+    A JWT revoked before it expires, found by its ``jti`` claim
+
+    Checked on every request through ``app/revocation.py``.
+    """
+
+    jti = models.CharField(max_length=255, primary_key=True)
+    user = models.ForeignKey("CustomUser", on_delete=models.CASCADE)
+    # Expired rows can go; the token is rejected anyway
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.jti
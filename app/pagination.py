@@ -1,7 +1,147 @@
+import json
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Largest count that ``estimate_count`` reports exactly without a planner
+COUNT_LIMIT = 10_000
 
 
 class ModelPagination(CursorPagination):
+    """
+    Keyset pagination over ``ordering``, whose last field must be unique
+
+    The cursor stores the full ordering key of the boundary row, so pages are
+    fetched with ``WHERE (name, pk) < (...)`` style filters that an index on
+    the same columns answers with a seek; rows sharing a name are never
+    skipped or repeated.
+
+    With ``?count=estimate`` the page also carries the total row count, taken
+    from the view's ``estimate_count`` or from ``estimate_count`` below, and
+    whether that count is exact.
+    """
+
     page_size = 5
-    # page_size_query_param = 'page_size'
-    ordering = "-name"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-name", "-pk")
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        reverse, position = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "estimate":
+            self.count = getattr(view, "estimate_count", estimate_count)(queryset)
+
+        ordering = self.get_ordering(request, queryset, view)
+        if reverse:
+            ordering = tuple(flip(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(after(ordering, position))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.ordering = ordering if not reverse else tuple(map(flip, ordering))
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = {"next": self.get_next_link(), "previous": self.get_previous_link()}
+        if self.count is not None:
+            response["count"], response["count_exact"] = self.count
+        response["results"] = data
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.get_position(self.page[0]))
+
+    def get_position(self, row):
+        fields = [field.lstrip("-") for field in self.ordering]
+        if isinstance(row, dict):
+            return [str(row[field]) for field in fields]
+        return [str(getattr(row, field)) for field in fields]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            position = json.loads(tokens["p"][0])
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def encode_cursor(self, reverse, position):
+        tokens = {"p": json.dumps(position)}
+        if reverse:
+            tokens["r"] = "1"
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+def estimate_count(queryset):
+    """
+    ``(count, exact)`` for ``queryset`` without a full ``COUNT(*)``
+
+    PostgreSQL reports the planner's row estimate. Elsewhere the rows are
+    counted up to ``COUNT_LIMIT``; larger results report the limit.
+    """
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor == "postgresql":
+        plan = json.loads(queryset.explain(format="json"))
+        return plan[0]["Plan"]["Plan Rows"], False
+    count = queryset[: COUNT_LIMIT + 1].count()
+    return min(count, COUNT_LIMIT), count <= COUNT_LIMIT
+
+
+def flip(field):
+    return field[1:] if field.startswith("-") else f"-{field}"
+
+
+def after(ordering, position):
+    """
+    Filter for the rows that come after ``position`` in ``ordering``
+
+    The expanded ``a < x OR (a = x AND b < y)`` form is wrapped in an
+    inclusive range on the leading field, so SQLite walks a single index
+    range in order instead of merging index lookups and sorting the result.
+    """
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, position):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+    field, value = ordering[0], position[0]
+    lookup = "lte" if field.startswith("-") else "gte"
+    return Q(**{f"{field.lstrip('-')}__{lookup}": value}) & condition
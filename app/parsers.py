@@ -0,0 +1,33 @@
+import json
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Lazily parse a JSON Lines (NDJSON) request body
+
+    ``request.data`` becomes an iterator of ``(line_number, row, error)``
+    tuples that reads the stream one line at a time, so the body is never
+    held in memory as a whole. ``error`` is set when a line is not valid JSON.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        return self.iter_lines(stream, encoding)
+
+    def iter_lines(self, stream, encoding):
+        if stream is None:
+            return
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line.decode(encoding)), None
+            except (ValueError, UnicodeDecodeError) as exc:
+                yield line_number, None, f"JSON parse error - {exc}"
@@ -0,0 +1,161 @@
+"""
+Flat city read model, kept in sync by every write path.
+
+A ``CityRecord`` holds a city's own columns together with the name and codes
+of its state and country and the id of the country's owner, so city lists,
+filters and rankings read a single table without joins. Writes update the
+records inside their own transaction, in a constant number of queries per
+batch like the demographic rollups:
+
+- saved cities are copied with one joined ``values()`` query and one upsert
+  (``save_cities``)
+- updated states and countries rewrite the copied columns of their records
+  with one ``UPDATE ... CASE`` statement (``update_states``,
+  ``update_countries``)
+- deleted cities, states, countries and users take their records along
+  (``remove``)
+
+``manage.py rebuild_city_records`` recreates every record from the City table.
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .models import City, CityRecord, Country, State
+
+# City columns copied as they are, by attname
+CITY_COLUMNS = [field.attname for field in City._meta.concrete_fields]
+# Record column: the parent column it copies, from a city, state or country
+CITY_PARENT_COLUMNS = {
+    "state_name": "state__name",
+    "gst_code": "state__gst_code",
+    "country_id": "state__country_id",
+    "country_name": "state__country__name",
+    "country_code": "state__country__country_code",
+    "owner_id": "state__country__my_user_id",
+}
+STATE_COLUMNS = {
+    "state_name": "name",
+    "gst_code": "gst_code",
+    "country_id": "country_id",
+    "country_name": "country__name",
+    "country_code": "country__country_code",
+    "owner_id": "country__my_user_id",
+}
+COUNTRY_COLUMNS = {
+    "country_name": "name",
+    "country_code": "country_code",
+    "owner_id": "my_user_id",
+}
+UPDATE_FIELDS = [
+    field.name for field in CityRecord._meta.concrete_fields if not field.primary_key
+]
+
+# Keeps the CASE statements well below the database parameter limits
+UPDATE_BATCH_SIZE = 100
+
+
+def city_rows(queryset):
+    """
+    ``values()`` rows of ``queryset`` that build records with ``CityRecord(**row)``
+    """
+    return queryset.values(
+        *CITY_COLUMNS,
+        **{column: F(path) for column, path in CITY_PARENT_COLUMNS.items()},
+    )
+
+
+def save_cities(cities):
+    """
+    Create or refresh the records of saved cities, e.g. after a bulk_create
+    """
+    from .ingest import BATCH_SIZE, chunked
+
+    for chunk in chunked(city.pk for city in cities):
+        records = [
+            CityRecord(**row) for row in city_rows(City.objects.filter(pk__in=chunk))
+        ]
+        CityRecord.objects.bulk_create(
+            records,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=UPDATE_FIELDS,
+        )
+
+
+def update_columns(key, rows, columns):
+    """
+    Set ``columns`` of the records whose ``key`` column matches each row
+
+    ``rows`` are ``(key value, *column values)`` tuples.
+    """
+    from .ingest import chunked
+
+    for chunk in chunked(rows, UPDATE_BATCH_SIZE):
+        CityRecord.objects.filter(**{f"{key}__in": [row[0] for row in chunk]}).update(
+            **{
+                column: Case(
+                    *[When(**{key: row[0]}, then=Value(row[index])) for row in chunk],
+                    default=F(column),
+                    output_field=CityRecord._meta.get_field(column),
+                )
+                for index, column in enumerate(columns, start=1)
+            }
+        )
+
+
+def update_parents(model, columns, key, pks):
+    from .ingest import chunked
+
+    rows = []
+    for chunk in chunked(set(pks)):
+        rows.extend(
+            model.objects.filter(pk__in=chunk).values_list("pk", *columns.values())
+        )
+    update_columns(key, rows, list(columns))
+
+
+def update_states(state_ids):
+    """
+    Copy the current name, codes and country of states into their records
+    """
+    update_parents(State, STATE_COLUMNS, "state_id", state_ids)
+
+
+def update_countries(country_ids):
+    """
+    Copy the current name, code and owner of countries into their records
+    """
+    update_parents(Country, COUNTRY_COLUMNS, "country_id", country_ids)
+
+
+def remove(key, values):
+    """
+    Delete the records whose ``key`` column ("id", "state_id", ...) is in values
+    """
+    from .ingest import chunked
+
+    for chunk in chunked(set(values)):
+        CityRecord.objects.filter(**{f"{key}__in": chunk}).delete()
+
+
+def rebuild():
+    """
+    Recreate every record from the City table
+    """
+    from .ingest import BATCH_SIZE
+
+    total = 0
+    with transaction.atomic():
+        CityRecord.objects.all().delete()
+        records = []
+        for row in city_rows(City.objects.order_by()).iterator(chunk_size=BATCH_SIZE):
+            records.append(CityRecord(**row))
+            if len(records) == BATCH_SIZE:
+                CityRecord.objects.bulk_create(records)
+                total += len(records)
+                records = []
+        CityRecord.objects.bulk_create(records)
+        total += len(records)
+    return total
@@ -0,0 +1,103 @@
+"""
+Cached resolution of parent references in write payloads.
+
+States reference their country by ``country`` (primary key) or by
+``country_code``, cities their state by ``state`` or by ``gst_code``. Both
+kinds of key go through a process-local map per model and key field; all the
+keys of a payload that the map lacks are loaded with one ``IN`` query. Parents
+come back as deferred instances that carry only the columns the write paths
+need (the state's country for the demographic rollups); anything else loads
+on access.
+
+New parents never invalidate a mapping, so the maps only go stale when a
+parent is updated or deleted. Those writes bump a version shared through the
+cache backend, which empties the maps of every process on their next lookup.
+"""
+
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import cache
+from .models import Country, State
+
+VERSION_KEY = "geo:references:version"
+NATURAL_KEYS = {Country: "country_code", State: "gst_code"}
+# Columns kept per parent; the primary key comes first
+COLUMNS = {Country: ["id"], State: ["id", "country_id"]}
+# Keys loaded per query, so a thousand-row payload costs one query at most
+RESOLVE_BATCH_SIZE = 1000
+# The maps are emptied rather than evicted from once they reach this size
+MAX_SIZE = 100_000
+
+
+class Resolver:
+    """
+    Map of ``model.key`` values to the stored columns of their rows
+    """
+
+    def __init__(self, model, key):
+        self.model = model
+        self.key = key
+        self.columns = COLUMNS[model]
+        self.rows = {}
+        self.version = None
+        self.lock = threading.Lock()
+
+    def resolve(self, values, queryset=None):
+        """
+        Return ``{value: instance}`` for the ``values`` that exist
+
+        With ``queryset``, all values are loaded as full instances from it
+        (e.g. with ``select_related``), which also refreshes the map.
+        """
+        version = cache.get_version(VERSION_KEY)
+        with self.lock:
+            if version != self.version or len(self.rows) > MAX_SIZE:
+                self.rows, self.version = {}, version
+            rows = self.rows
+
+        if queryset is not None:
+            instances = {}
+            values = list(set(values))
+            for start in range(0, len(values), RESOLVE_BATCH_SIZE):
+                chunk = values[start : start + RESOLVE_BATCH_SIZE]
+                for instance in queryset.filter(**{f"{self.key}__in": chunk}):
+                    key = getattr(instance, self.key)
+                    rows[key] = tuple(getattr(instance, name) for name in self.columns)
+                    instances[key] = instance
+            return instances
+
+        missing = list({value for value in values if value not in rows})
+        for start in range(0, len(missing), RESOLVE_BATCH_SIZE):
+            chunk = missing[start : start + RESOLVE_BATCH_SIZE]
+            found = self.model.objects.filter(**{f"{self.key}__in": chunk})
+            for key, *row in found.values_list(self.key, *self.columns):
+                rows[key] = tuple(row)
+
+        return {
+            value: self.model.from_db(DEFAULT_DB_ALIAS, self.columns, rows[value])
+            for value in values
+            if value in rows
+        }
+
+
+resolvers = {
+    (model, key): Resolver(model, key)
+    for model, natural_key in NATURAL_KEYS.items()
+    for key in ("pk", natural_key)
+}
+
+
+def resolve(model, key, values, queryset=None):
+    """
+    Parents of ``model`` whose ``key`` ("pk" or the natural key) is in values
+    """
+    return resolvers[(model, key)].resolve(values, queryset)
+
+
+def invalidate():
+    """
+    Drop every process's mappings once the current transaction commits
+    """
+    transaction.on_commit(lambda: cache.bump_version(VERSION_KEY))
@@ -0,0 +1,101 @@
+"""
+Revocation of JWTs before they expire, keyed on their ``jti`` claim.
+
+Revoked tokens are stored in the ``RevokedToken`` table (its primary key is
+the ``jti``) until they expire. Every process keeps the ids of the unexpired
+ones in a set, which the access token class checks on every request, so the
+check is a set lookup plus a read of the shared version from the cache
+backend. Revoking a token bumps that version once the transaction commits.
+Other processes then reload the set on their next request.
+
+The set holds every unexpired revocation, so a lookup has no false positives
+or misses and needs no bloom filter. Its size is bounded by the number of
+logouts within one token lifetime.
+"""
+
+import threading
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from . import cache
+from .models import RevokedToken
+
+VERSION_KEY = "auth:revocations:version"
+
+
+class RevocationList:
+    """
+    Process-local copy of the unexpired revoked token ids
+    """
+
+    def __init__(self):
+        self.jtis = {}  # jti: expiry
+        self.version = None
+        self.lock = threading.Lock()
+
+    def load(self, version):
+        rows = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        jtis = dict(rows.values_list("jti", "expires_at"))
+        with self.lock:
+            self.jtis, self.version = jtis, version
+
+    def contains(self, jti):
+        version = cache.get_version(VERSION_KEY)
+        if version != self.version:
+            self.load(version)
+        return jti in self.jtis
+
+    def add(self, jtis):
+        with self.lock:
+            self.jtis = {**self.jtis, **jtis}
+
+
+revoked = RevocationList()
+
+
+def is_revoked(jti):
+    return revoked.contains(jti)
+
+
+def revoke(tokens, user):
+    """
+    Revoke validated ``tokens`` of ``user`` in every process
+
+    Also drops the rows of tokens that have expired since.
+    """
+    jtis = {
+        token[api_settings.JTI_CLAIM]: datetime_from_epoch(token["exp"])
+        for token in tokens
+    }
+    with transaction.atomic():
+        RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        RevokedToken.objects.bulk_create(
+            [
+                RevokedToken(jti=jti, user=user, expires_at=expires_at)
+                for jti, expires_at in jtis.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+        def publish():
+            revoked.add(jtis)
+            cache.bump_version(VERSION_KEY)
+
+        transaction.on_commit(publish)
+
+
+class RevocableAccessToken(AccessToken):
+    """
+    Access token that fails verification once revoked
+    """
+
+    def verify(self):
+        super().verify()
+        if is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is revoked"))
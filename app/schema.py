@@ -0,0 +1,13 @@
+"""
+OpenAPI extensions for drf-spectacular, registered when the app is ready.
+"""
+
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """
+    ``CachedJWTAuthentication`` reads the same bearer tokens as simplejwt
+    """
+
+    target_class = "app.authentication.CachedJWTAuthentication"
@@ -1,6 +1,7 @@
 from django.db import transaction
-from django.db.models import Min, Max
-from app.models import Country, CustomUser, State, City
+from app import records
+from app.analytics import city_rankings
+from app.models import Country, CustomUser, State, City, CityRecord
 
 # CustomUser
 
@@ -219,6 +220,8 @@ def run():
             ),
         ]
         City.objects.bulk_create(cities, ignore_conflicts=True)
+        # bulk_create sends no signals; copy the inserted cities to the records
+        records.save_cities(cities)
         print("Bulk insert cities complete.")
 
     # Bulk Update Data
@@ -240,6 +243,7 @@ def run():
         for city in cities:
             city.avg_age = round(city.avg_age + 0.5, 2)
         City.objects.bulk_update(cities, ["avg_age"])
+        records.save_cities(cities)
         print("Bulk update complete")
 
     # Fetch all Countries, States, and Cities
@@ -249,22 +253,23 @@ def run():
         for country in countries:
             print(f"- {country.name}")
 
-        states = State.objects.all()
+        # Parent names are annotated, so each list is a single query
+        states = State.objects.with_hierarchy()
         print("\nAll States:")
         for state in states:
-            print(f"- {state.name} (Country: {state.country.name})")
+            print(f"- {state.name} (Country: {state.country_name})")
 
-        cities = City.objects.all()
+        cities = City.objects.with_hierarchy()
         print("\nAll Cities:")
-        for city in cities:
+        for city in cities.iterator():
             print(
-                f"- {city.name} (State: {city.state.name}, Country: {city.state.country.name})"
+                f"- {city.name} (State: {city.state_name}, Country: {city.country_name})"
             )
 
     # Fetch all cities of a State
     def fetch_state_cities():
         gujarat = State.objects.get(name="Gujarat")
-        gujarat_cities = City.objects.filter(state=gujarat)
+        gujarat_cities = City.objects.filter(state=gujarat).order_by("name")
         print(f"\nCities in {gujarat.name}:")
         for city in gujarat_cities:
             print(f"- {city.name}")
@@ -272,7 +277,7 @@ def run():
     # Fetch all states of a Country
     def fetch_country_states():
         india = Country.objects.get(name="India")
-        india_states = State.objects.filter(country=india)
+        india_states = State.objects.filter(country=india).order_by("name")
         print(f"\nStates in {india.name}:")
         for state in india_states:
             print(f"- {state.name}")
@@ -286,38 +291,27 @@ def run():
 
     # Fetch City of a Country with Minimum and Maximum Population
     def fetch_population_extremes():
-        india_population = City.objects.filter(state__country__name="India").aggregate(
-            min_population=Min("population"), max_population=Max("population")
+        # One windowed query finds both cities instead of aggregate + lookups
+        rankings = city_rankings(
+            CityRecord.objects.filter(country_name="India"),
+            "country",
+            "population",
+            top=1,
         )
+        india = rankings[0] if rankings else {}
+        min_pop_city = india.get("min")
+        max_pop_city = india.get("max")
         print("\nPopulation Extremes in India:")
-        print(f"Minimum Population: {india_population['min_population']}")
-        print(f"Maximum Population: {india_population['max_population']}")
-
-        # Find the actual cities with min and max population
-        min_pop_city = City.objects.filter(
-            state__country__name="India", population=india_population["min_population"]
-        ).first()
-        max_pop_city = City.objects.filter(
-            state__country__name="India", population=india_population["max_population"]
-        ).first()
-
-        if min_pop_city:
-            print(f"Minimum Population: {min_pop_city.population}")
-        else:
-            print("No city found with minimum population")
-
-        if max_pop_city:
-            print(f"Maximum Population: {max_pop_city.population}")
-        else:
-            print("No city found with maximun population")
 
         if min_pop_city:
-            print(f"City with Minimum Population: {min_pop_city.name}")
+            print(f"Minimum Population: {min_pop_city['population']}")
+            print(f"City with Minimum Population: {min_pop_city['name']}")
         else:
             print("No city found with minimum population")
 
         if max_pop_city:
-            print(f"City with Maximum Population: {max_pop_city.name}")
+            print(f"Maximum Population: {max_pop_city['population']}")
+            print(f"City with Maximum Population: {max_pop_city['name']}")
         else:
             print("No city found with maximum population")
 
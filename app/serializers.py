@@ -1,9 +1,24 @@
 from rest_framework import serializers
-from rest_framework.validators import UniqueValidator
-from .models import CustomUser, Country, State, City
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
+from . import autocomplete, cache, demographics, fieldsets, records, references
+from .models import (
+    CustomUser,
+    Country,
+    State,
+    City,
+    ImportJob,
+    CountryDemographics,
+    StateDemographics,
+)
 from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch
 from django.utils.translation import gettext as _
 
+# Most ids or codes read by one batch request
+MAX_BATCH_SIZE = 500
+
 
 class CustomUserSerializer(serializers.ModelSerializer):
     """
@@ -23,7 +38,110 @@ class CustomUserSerializer(serializers.ModelSerializer):
         return user
 
 
-class CountrySerializer(serializers.ModelSerializer):
+class FieldsetMixin:
+    """
+    Drop the fields left out by the request's ``?fields=`` / ``?expand=``
+
+    The parsed fieldset is passed as ``context["fieldset"]``; serializers
+    nested as fields look up their own branch of it.
+    """
+
+    expandable_fields = []
+
+    @property
+    def fieldset(self):
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        fieldset = self.context.get("fieldset")
+        for name in reversed(path):
+            fieldset = fieldsets.child(fieldset, name)
+        return fieldset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.fieldset
+        if fieldset is None:
+            return fields
+        return {
+            name: field
+            for name, field in fields.items()
+            if fieldsets.wants(fieldset, name, nested=name in self.expandable_fields)
+        }
+
+
+class CachedRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Parent reference by primary key or, with ``key``, by natural key
+
+    Lookups go through the cached maps in ``references.py``.
+    """
+
+    default_error_messages = {
+        **serializers.PrimaryKeyRelatedField.default_error_messages,
+        "does_not_exist_key": serializers.SlugRelatedField.default_error_messages[
+            "does_not_exist"
+        ],
+    }
+
+    def __init__(self, key="pk", **kwargs):
+        self.key = key
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        if self.key != "pk":
+            if not isinstance(data, str):
+                self.fail("incorrect_type", data_type=type(data).__name__)
+            found = references.resolve(model, self.key, [data])
+            if data not in found:
+                self.fail("does_not_exist_key", slug_name=self.key, value=data)
+            return found[data]
+
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            value = model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        found = references.resolve(model, "pk", [value])
+        if value not in found:
+            self.fail("does_not_exist", pk_value=data)
+        return found[value]
+
+
+class ParentReferenceMixin:
+    """
+    Require the parent, given by primary key or by its natural key field
+
+    Bulk ingest resolves parents for the whole batch itself.
+    """
+
+    parent_field = None
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if self.partial or self.context.get("bulk") or self.parent_field in attrs:
+            return attrs
+        raise serializers.ValidationError(
+            {self.parent_field: [serializers.Field.default_error_messages["required"]]}
+        )
+
+
+def model_columns(model, fieldset, *required):
+    """
+    Concrete model fields to load for ``fieldset``, plus ``required``
+    """
+    columns = set(required)
+    for field in model._meta.concrete_fields:
+        if fieldsets.wants(fieldset, field.name):
+            columns.add(field.name)
+    return columns
+
+
+class CountrySerializer(FieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for Country model with nested state serialization
     """
@@ -48,6 +166,40 @@ class CountrySerializer(serializers.ModelSerializer):
             "my_user": {"read_only": True},
         }
 
+    expandable_fields = ["states"]
+
+    @staticmethod
+    def setup_eager_loading(queryset, fieldset=None):
+        """
+        Load owners, states and cities up front so no field queries per row
+
+        With a fieldset only the requested columns and relations are loaded.
+        """
+        if fieldset is None:
+            return queryset.select_related("my_user").prefetch_related(
+                Prefetch("states", queryset=State.objects.prefetch_related("cities"))
+            )
+
+        # The name orders the cursor pagination
+        columns = model_columns(Country, fieldset, "id", "name")
+        owner = fieldsets.wants(fieldset, "my_user_name")
+        if fieldsets.wants(fieldset, "states", nested=True):
+            states = fieldsets.child(fieldset, "states")
+            # Nested states read their country's owner from the parent row
+            owner = owner or fieldsets.wants(states, "my_country__my_user__name")
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "states",
+                    queryset=StateSerializer.setup_eager_loading(
+                        State.objects.all(), states, nested=True
+                    ),
+                )
+            )
+        if owner:
+            queryset = queryset.select_related("my_user")
+            columns |= {"my_user", "my_user__email"}
+        return queryset.only(*columns)
+
     def create(self, validated_data):
         user = self.context["request"].user
         return Country.objects.create(my_user=user, **validated_data)
@@ -56,7 +208,8 @@ class CountrySerializer(serializers.ModelSerializer):
         """
         Retrieve nested states for a country
         """
-        return StateSerializer(obj.states.prefetch_related("cities"), many=True).data
+        context = {**self.context, "fieldset": fieldsets.child(self.fieldset, "states")}
+        return StateSerializer(obj.states.all(), many=True, context=context).data
 
     def get_my_user_name(self, obj):
         """
@@ -65,11 +218,57 @@ class CountrySerializer(serializers.ModelSerializer):
         return obj.my_user.email if obj.my_user else None
 
 
-class CitySerializer(serializers.ModelSerializer):
+class CityListSerializer(serializers.ListSerializer):
+    """
+    List serializer for City that validates a whole batch at once
+    """
+
+    def to_internal_value(self, data):
+        """
+        Resolve states and check unique codes with one IN query per field
+        """
+        from .ingest import GeoIngest
+
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        validated, _, errors = GeoIngest(self.context).validate_flat(
+            City, type(self.child), data, State, "state"
+        )
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated
+
+    def create(self, validated_data):
+        from .ingest import BATCH_SIZE
+
+        cities = [City(**attrs) for attrs in validated_data]
+        with transaction.atomic():
+            City.objects.bulk_create(cities, batch_size=BATCH_SIZE)
+            demographics.add_cities(cities)
+            records.save_cities(cities)
+            cache.invalidate()
+            autocomplete.add(cities)
+        return cities
+
+
+class CitySerializer(ParentReferenceMixin, FieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for City model with state details
+
+    The state is given as ``state`` (id) or ``gst_code``.
     """
 
+    serializer_related_field = CachedRelatedField
+    parent_field = "state"
+
+    gst_code = CachedRelatedField(
+        queryset=State.objects.all(),
+        key="gst_code",
+        source="state",
+        write_only=True,
+        required=False,
+    )
     name = serializers.CharField()
     city_code = serializers.CharField()
     phone_code = serializers.CharField()
@@ -81,12 +280,26 @@ class CitySerializer(serializers.ModelSerializer):
     class Meta:
         model = City
         fields = "__all__"
-        extra_kwargs = {}
+        extra_kwargs = {"state": {"required": False}}
+        list_serializer_class = CityListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset, fieldset=None, nested=False):
+        """
+        Load only the requested columns; cities have no relations to follow
+        """
+        if fieldset is None:
+            return queryset
+        columns = model_columns(City, fieldset, "id", "name")
+        if nested:
+            columns.add("state")
+        return queryset.only(*columns)
 
     def validate(self, attrs):
         """
         Custom validation to ensure population > sum of adult males and females
         """
+        attrs = super().validate(attrs)
         if attrs["population"] <= (
             attrs["num_of_adult_males"] + attrs["num_of_adult_females"]
         ):
@@ -99,6 +312,9 @@ class CitySerializer(serializers.ModelSerializer):
         """
         Custom validation to ensure city_code is unique
         """
+        if self.context.get("bulk"):
+            # Checked once for the whole batch by the bulk ingest
+            return value
         if City.objects.filter(city_code=value).exists():
             raise serializers.ValidationError("City code must be unique")
         return value
@@ -107,6 +323,9 @@ class CitySerializer(serializers.ModelSerializer):
         """
         Custom validation to ensure phone_code is unique
         """
+        if self.context.get("bulk"):
+            # Checked once for the whole batch by the bulk ingest
+            return value
         if City.objects.filter(phone_code=value).exists():
             raise serializers.ValidationError("Phone code must be unique")
         return value
@@ -115,19 +334,30 @@ class CitySerializer(serializers.ModelSerializer):
         """
         Retrieve state name for the city
         """
-        return obj.state.name
+        return obj.state_name
 
 
-class StateSerializer(serializers.ModelSerializer):
+class StateSerializer(ParentReferenceMixin, FieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for State model with nested city and country details
+
+    The country is given as ``country`` (id) or ``country_code``.
     """
 
+    parent_field = "country"
+
     cities = CitySerializer(many=True, required=False)
     name = serializers.CharField(max_length=100)
     state_code = serializers.CharField(max_length=10)
     gst_code = serializers.CharField(max_length=15)
-    country = serializers.PrimaryKeyRelatedField(queryset=Country.objects.all())
+    country = CachedRelatedField(queryset=Country.objects.all(), required=False)
+    country_code = CachedRelatedField(
+        queryset=Country.objects.all(),
+        key="country_code",
+        source="country",
+        write_only=True,
+        required=False,
+    )
     my_country__name = serializers.SerializerMethodField()
     my_country__my_user__name = serializers.SerializerMethodField()
 
@@ -137,6 +367,46 @@ class StateSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             "gst_code": {"validators": [UniqueValidator(queryset=State.objects.all())]},
         }
+        # Declared because two fields (country, country_code) set the country
+        validators = [
+            UniqueTogetherValidator(
+                queryset=State.objects.all(), fields=["country", "name"]
+            )
+        ]
+
+    expandable_fields = ["cities"]
+
+    @staticmethod
+    def setup_eager_loading(queryset, fieldset=None, nested=False):
+        """
+        Annotate country names and owners and load cities up front
+
+        ``nested`` querysets are prefetched under their country, which then
+        provides the country fields.
+        """
+        if fieldset is None:
+            if nested:
+                return queryset.prefetch_related("cities")
+            return queryset.with_hierarchy().prefetch_related("cities")
+
+        columns = model_columns(State, fieldset, "id", "name")
+        if nested:
+            columns.add("country")
+        elif fieldsets.wants(fieldset, "my_country__name") or fieldsets.wants(
+            fieldset, "my_country__my_user__name"
+        ):
+            queryset = queryset.with_hierarchy()
+        if fieldsets.wants(fieldset, "cities", nested=True):
+            cities = fieldsets.child(fieldset, "cities")
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "cities",
+                    queryset=CitySerializer.setup_eager_loading(
+                        City.objects.all(), cities, nested=True
+                    ),
+                )
+            )
+        return queryset.only(*columns)
 
     def get_cities(self, obj):
         """
@@ -148,13 +418,13 @@ class StateSerializer(serializers.ModelSerializer):
         """
         Retrieve country name for the state
         """
-        return obj.country.name
+        return obj.country_name
 
     def get_my_country__my_user__name(self, obj):
         """
         Retrieve username of country's associated user
         """
-        return obj.country.my_user.email if obj.country.my_user else None
+        return obj.country_user_name
 
     def create(self, validated_data):
         """
@@ -173,6 +443,73 @@ class StateSerializer(serializers.ModelSerializer):
         return state
 
 
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the progress of a background import job
+    """
+
+    class Meta:
+        model = ImportJob
+        exclude = ["payload", "my_user"]
+
+
+class StateDemographicsSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the stored city totals of a state
+    """
+
+    class Meta:
+        model = StateDemographics
+        fields = "__all__"
+
+
+class CountryDemographicsSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the stored city totals of a country and its states
+    """
+
+    states = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CountryDemographics
+        fields = "__all__"
+
+    def get_states(self, obj):
+        """
+        Retrieve the totals of every state of the country
+        """
+        return StateDemographicsSerializer(
+            StateDemographics.objects.filter(country_id=obj.country_id), many=True
+        ).data
+
+
+class BatchLookupSerializer(serializers.Serializer):
+    """
+    Serializer for the ``ids`` or ``codes`` of a batch read
+    """
+
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+    codes = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+
+    def validate(self, attrs):
+        """
+        Custom validation to ensure exactly one of ids and codes is given
+        """
+        if len(attrs) != 1:
+            raise serializers.ValidationError("Give either ids or codes.")
+        return attrs
+
+
 class AuthTokenSerializer(serializers.Serializer):
     """Serializer for the user auth token."""
 
@@ -0,0 +1,183 @@
+"""
+Receivers that keep derived data current on model writes.
+
+Cities have no delete receivers: Django then deletes the cities of a deleted
+state or country with one ``DELETE`` instead of loading them and sending a
+signal per row. The receivers of the deleted parent take the cities' derived
+rows along, once per cascade. Direct city deletes go through
+``delete_cities``.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import authentication, autocomplete, cache, demographics, records, references
+from .models import CustomUser, Country, State, City
+
+
+def deleted_with(origin, model):
+    """
+    Whether a delete started from ``model`` rows (an instance or a queryset)
+    """
+    return isinstance(origin, model) or getattr(origin, "model", None) is model
+
+
+def delete_cities(queryset, delete):
+    """
+    Run ``delete()`` for the cities of ``queryset`` and take them off the
+    rollups, flat records, cached responses and autocomplete index
+
+    Used by ``City.delete()`` and ``CityQuerySet.delete()``.
+    """
+    with transaction.atomic(using=queryset.db):
+        pks = list(queryset.values_list("pk", flat=True))
+        deltas = demographics.stored_cities_values(City.objects.filter(pk__in=pks))
+        result = delete()
+        demographics.apply(deltas)
+        records.remove("id", pks)
+        cache.invalidate()
+        autocomplete.remove(pks)
+    return result
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=State)
+@receiver(post_save, sender=City)
+def invalidate_geo_cache(sender, **kwargs):
+    """
+    Cached geo responses embed all of these models
+    """
+    cache.invalidate()
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=State)
+def invalidate_geo_cache_on_delete(sender, origin=None, **kwargs):
+    # Once for the row whose delete cascaded to the others
+    if origin is None or deleted_with(origin, sender):
+        cache.invalidate()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_users(sender, **kwargs):
+    """
+    Updated, deactivated and deleted users must not authenticate from cache
+    """
+    authentication.invalidate()
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=State)
+@receiver(post_save, sender=City)
+def index_geo_name(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.add([instance])
+
+
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=State)
+def unindex_geo_name(sender, instance, origin=None, **kwargs):
+    # The index drops the children of removed rows itself
+    if sender is Country or origin is None or deleted_with(origin, State):
+        autocomplete.remove([instance.pk])
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=State)
+def invalidate_references(sender, created=False, **kwargs):
+    """
+    New parents leave the cached code and id maps valid; nothing else does
+    """
+    if not created:
+        references.invalidate()
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=State)
+def invalidate_deleted_references(sender, origin=None, **kwargs):
+    if origin is None or deleted_with(origin, sender):
+        references.invalidate()
+
+
+@receiver(pre_save, sender=City)
+def remember_stored_city(sender, instance, raw=False, **kwargs):
+    instance._stored_demographics = None
+    if not raw and not instance._state.adding:
+        instance._stored_demographics = demographics.stored_city_values(instance.pk)
+
+
+@receiver(post_save, sender=City)
+def update_city_demographics(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = [demographics.city_values(instance)]
+    stored = getattr(instance, "_stored_demographics", None)
+    if stored is not None:
+        deltas.append(stored)
+    demographics.apply(deltas)
+
+
+@receiver(pre_save, sender=State)
+def remember_stored_country(sender, instance, raw=False, **kwargs):
+    instance._stored_country_id = None
+    if not raw and not instance._state.adding:
+        instance._stored_country_id = (
+            State.objects.filter(pk=instance.pk)
+            .values_list("country_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=State)
+def move_state_demographics(sender, instance, raw=False, **kwargs):
+    stored = getattr(instance, "_stored_country_id", None)
+    if not raw and stored is not None and stored != instance.country_id:
+        demographics.move_states({instance.pk: instance.country_id})
+
+
+@receiver(pre_delete, sender=State)
+def remove_state_demographics(sender, instance, origin=None, **kwargs):
+    # Rollups of a deleted country go away with it
+    if origin is None or deleted_with(origin, State):
+        demographics.remove_states([instance.pk])
+
+
+@receiver(post_save, sender=City)
+def save_city_record(sender, instance, raw=False, **kwargs):
+    if not raw:
+        records.save_cities([instance])
+
+
+@receiver(post_save, sender=State)
+def update_state_records(sender, instance, created=False, raw=False, **kwargs):
+    # A new state has no cities yet
+    if not raw and not created:
+        records.update_states([instance.pk])
+
+
+@receiver(post_save, sender=Country)
+def update_country_records(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        records.update_countries([instance.pk])
+
+
+# Record column that points at each deleted model
+RECORD_KEYS = {
+    State: "state_id",
+    Country: "country_id",
+    CustomUser: "owner_id",
+}
+
+
+@receiver(pre_delete, sender=State)
+@receiver(pre_delete, sender=Country)
+@receiver(pre_delete, sender=CustomUser)
+def remove_city_records(sender, instance, origin=None, **kwargs):
+    # Cascades remove all records of the deleted row in one statement
+    if origin is None or deleted_with(origin, sender):
+        records.remove(RECORD_KEYS[sender], [instance.pk])
@@ -1,3 +1,2183 @@
-from django.test import TestCase
+import contextlib
+import csv
+import io
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from itertools import count
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import authentication, autocomplete, export, jobs, records, revocation
+from .models import (
+    CustomUser,
+    Country,
+    State,
+    City,
+    CityRecord,
+    ImportJob,
+    RevokedToken,
+    StateDemographics,
+)
+from .ingest import COUNTRY_LEVELS, GeoIngest
+from .pagination import ModelPagination, after
+from .readers import Reader
+from .scripts import queries
+from .serializers import (
+    MAX_BATCH_SIZE,
+    CountrySerializer,
+    StateSerializer,
+    CitySerializer,
+)
+
+# Comma separated city counts, e.g. GEO_BENCH_SIZES=10,1000,100000
+BENCH_SIZES = [
+    int(size) for size in os.environ.get("GEO_BENCH_SIZES", "10,1000").split(",")
+]
+BENCH_REPEAT = int(os.environ.get("GEO_BENCH_REPEAT", "5"))
+# JSON file with latency baselines; GEO_BENCH_RECORD=1 (re)writes it
+BENCH_BASELINE = os.environ.get("GEO_BENCH_BASELINE")
+BENCH_RECORD = os.environ.get("GEO_BENCH_RECORD") == "1"
+# Allowed p95 slowdown against the baseline, as a fraction
+BENCH_TOLERANCE = float(os.environ.get("GEO_BENCH_TOLERANCE", "0.5"))
+
+STATES_PER_COUNTRY = 10
+CITIES_PER_STATE = 10
+
+# Maximum queries per request; they must not grow with the dataset size.
+# Reads include the one ETag/Last-Modified validator query, city writes the
+# four statements that maintain the demographic rollups.
+QUERY_BUDGETS = {
+    "country-list": 4,
+    "country-list-cached": 0,
+    "country-list-sparse": 2,
+    "country-detail": 4,
+    "state-list": 3,
+    "state-detail": 3,
+    "city-list": 2,
+    "city-list-filtered": 3,
+    "city-detail": 2,
+    "city-batch": 1,
+    "city-rankings": 1,
+    "city-autocomplete": 0,
+    "city-export": 1,
+    "country-bulk-create": 18,
+    "state-bulk-create": 15,
+    "city-bulk-create": 10,
+    "city-ingest": 10,
+    "city-upsert": 11,
+}
+
+
+def city_data(code, **extra):
+    return {
+        "name": f"City {code}",
+        "city_code": f"C{code}",
+        "phone_code": f"P{code}",
+        "population": 1000,
+        "avg_age": 31.5,
+        "num_of_adult_males": 300,
+        "num_of_adult_females": 300,
+        **extra,
+    }
+
+
+def country_data(code, states=(), **extra):
+    return {
+        "name": f"Country {code}",
+        "country_code": code,
+        "curr_symbol": "$",
+        "phone_code": f"+{code}",
+        "states": list(states),
+        **extra,
+    }
+
+
+def state_data(code, cities=(), **extra):
+    return {
+        "name": f"State {code}",
+        "state_code": code,
+        "gst_code": f"G{code}",
+        "cities": list(cities),
+        **extra,
+    }
+
+
+# Silk records every request, which adds queries and buffers streamed bodies
+API_MIDDLEWARE = [name for name in settings.MIDDLEWARE if not name.startswith("silk")]
+
+
+@override_settings(MIDDLEWARE=API_MIDDLEWARE)
+class GeoAPITestCase(APITestCase):
+    """
+    Authenticated client over an empty geo dataset
+    """
+
+    def setUp(self):
+        cache.clear()  # Also resets throttling and the cached references
+        self.user = CustomUser.objects.create(email="geo@example.com")
+        self.client.force_authenticate(self.user)
+
+    def create_country(self, code="IN", user=None):
+        return Country.objects.create(
+            name=f"Country {code}",
+            country_code=code,
+            curr_symbol="$",
+            phone_code=f"+{code}",
+            my_user=user or self.user,
+        )
+
+    def create_state(self, country, code="GJ"):
+        return State.objects.create(
+            name=f"State {code}", state_code=code, gst_code=f"G{code}", country=country
+        )
+
+
+def consume(response):
+    """
+    Run a streamed response and keep its lines for the checks
+    """
+    response.lines = b"".join(response.streaming_content).decode().splitlines()
+    return response
+
+
+def render_serializer(serializer_class, queryset):
+    instances = serializer_class.setup_eager_loading(queryset)
+    return JSONRenderer().render(serializer_class(instances, many=True).data)
+
+
+def render_reader(serializer_class, queryset):
+    reader = Reader(serializer_class())
+    return JSONRenderer().render(reader.render(reader.values(queryset)))
+
+
+@tag("benchmark")
+@override_settings(MIDDLEWARE=API_MIDDLEWARE)
+class EndpointBenchmarkTests(APITestCase):
+    """
+    Query budgets and latency of the geo endpoints at several dataset sizes
+    """
+
+    results = {}
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(email="bench@example.com")
+        self.client.force_authenticate(self.user)
+        self.codes = count()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if BENCH_BASELINE and BENCH_RECORD:
+            with open(BENCH_BASELINE, "w") as handle:
+                json.dump(cls.results, handle, indent=2, sort_keys=True)
+
+    def seed(self, size):
+        """
+        Create ``size`` cities spread over states and countries
+        """
+        n_states = max(1, size // CITIES_PER_STATE)
+        n_countries = max(1, n_states // STATES_PER_COUNTRY)
+        countries = [
+            Country(
+                name=f"Country {i}",
+                country_code=f"{i:03x}"[-3:],
+                curr_symbol="$",
+                phone_code=f"+{i}",
+                my_user=self.user,
+            )
+            for i in range(n_countries)
+        ]
+        states = [
+            State(
+                name=f"State {i}",
+                state_code=f"S{i}",
+                gst_code=f"G{i}",
+                country=countries[i % n_countries],
+            )
+            for i in range(n_states)
+        ]
+        cities = [
+            City(state=states[i % n_states], **city_data(f"seed{i}"))
+            for i in range(size)
+        ]
+        Country.objects.bulk_create(countries)
+        State.objects.bulk_create(states, batch_size=1000)
+        City.objects.bulk_create(cities, batch_size=1000)
+        records.save_cities(cities)
+        return countries[0], states[0], cities[0]
+
+    def measure(self, name, size, request, check, cached=False):
+        """
+        Run ``request`` repeatedly, check its query budget and record latency
+
+        ``check(response)`` asserts the content of every response. Unless
+        ``cached`` is set, the response cache is cleared before every request
+        so the full ORM and serializer path is measured.
+        """
+        timings = []
+        if cached:
+            request()  # Prime the response cache
+        for _ in range(BENCH_REPEAT):
+            if cached:
+                cache.delete(f"throttle_user_{self.user.pk}")
+            else:
+                cache.clear()  # Also resets throttling
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+            check(response)
+            executed = [
+                query["sql"]
+                for query in queries.captured_queries
+                if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+            ]
+            self.assertLessEqual(
+                len(executed),
+                QUERY_BUDGETS[name],
+                f"{name} at {size} cities:\n" + "\n".join(executed),
+            )
+
+        timings.sort()
+        quantiles = statistics.quantiles(timings, n=20) if len(timings) > 1 else timings
+        self.results[f"{name}@{size}"] = {
+            "queries": len(executed),
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(quantiles[-1], 3),
+        }
+
+    def nested_country(self):
+        code = next(self.codes)
+        return {
+            "name": f"New {code}",
+            # Seeded codes are hex, so "z" prefixed codes never collide
+            "country_code": "z" + format(code % 256, "02x"),
+            "curr_symbol": "$",
+            "phone_code": f"+new{code}",
+            "states": [
+                {
+                    "name": f"New State {state}",
+                    "state_code": "NS",
+                    "gst_code": f"NG{code}-{state}",
+                    "cities": [
+                        city_data(f"n{code}-{state}-{city}") for city in range(20)
+                    ],
+                }
+                for state in range(3)
+            ],
+        }
+
+    def test_endpoint_budgets_and_latency(self):
+        for size in BENCH_SIZES:
+            with self.subTest(size=size), transaction.atomic():
+                country, state, city = self.seed(size)
+                self.run_endpoints(size, country, state, city)
+                transaction.set_rollback(True)
+        self.compare_with_baseline()
+
+    def assertStatus(self, response, status_code):
+        self.assertEqual(
+            response.status_code, status_code, getattr(response, "data", None)
+        )
+
+    def assertPage(self, queryset, response):
+        """
+        ``response`` is the first list page of ``queryset``
+        """
+        self.assertStatus(response, 200)
+        expected = queryset.order_by("-name", "-pk")[: ModelPagination.page_size]
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [str(pk) for pk in expected.values_list("pk", flat=True)],
+        )
+
+    def run_endpoints(self, size, country, state, city):
+        get = self.client.get
+        countries = Country.objects.filter(my_user=self.user)
+        states_of_country = State.objects.filter(country=country).count()
+        cities_of_state = City.objects.filter(state=state).count()
+
+        def check_country_list(response):
+            self.assertPage(countries, response)
+            first = response.data["results"][0]
+            self.assertEqual(
+                len(first["states"]), State.objects.filter(country=first["id"]).count()
+            )
+
+        self.measure(
+            "country-list", size, lambda: get("/app/countries/"), check_country_list
+        )
+
+        def check_sparse(response):
+            self.assertPage(countries, response)
+            self.assertEqual(
+                {tuple(sorted(row)) for row in response.data["results"]},
+                {("country_code", "id", "name")},
+            )
+
+        self.measure(
+            "country-list-sparse",
+            size,
+            lambda: get("/app/countries/?fields=id,name,country_code"),
+            check_sparse,
+        )
+
+        def check_country(response):
+            self.assertStatus(response, 200)
+            self.assertEqual(response.data["name"], country.name)
+            self.assertEqual(len(response.data["states"]), states_of_country)
+
+        self.measure(
+            "country-detail",
+            size,
+            lambda: get(f"/app/countries/{country.id}/"),
+            check_country,
+        )
+        self.measure(
+            "country-list-cached",
+            size,
+            lambda: get("/app/countries/"),
+            check_country_list,
+            cached=True,
+        )
+        self.measure(
+            "state-list",
+            size,
+            lambda: get("/app/states/"),
+            lambda response: self.assertPage(State.objects.all(), response),
+        )
+
+        def check_state(response):
+            self.assertStatus(response, 200)
+            self.assertEqual(response.data["gst_code"], state.gst_code)
+            self.assertEqual(len(response.data["cities"]), cities_of_state)
+
+        self.measure(
+            "state-detail", size, lambda: get(f"/app/states/{state.id}/"), check_state
+        )
+        self.measure(
+            "city-list",
+            size,
+            lambda: get("/app/cities/"),
+            lambda response: self.assertPage(City.objects.all(), response),
+        )
+
+        def check_filtered(response):
+            self.assertPage(City.objects.filter(state=state), response)
+            self.assertEqual(
+                (response.data["count"], response.data["count_exact"]),
+                (cities_of_state, True),
+            )
+
+        self.measure(
+            "city-list-filtered",
+            size,
+            lambda: get(
+                f"/app/cities/?state={state.id}&population__gte=1000&count=estimate"
+            ),
+            check_filtered,
+        )
+
+        def check_city(response):
+            self.assertStatus(response, 200)
+            self.assertEqual(response.data["city_code"], city.city_code)
+
+        self.measure(
+            "city-detail", size, lambda: get(f"/app/cities/{city.id}/"), check_city
+        )
+        batch = {"ids": list(City.objects.values_list("pk", flat=True)[:200])}
+
+        def check_batch(response):
+            self.assertStatus(response, 200)
+            self.assertEqual(
+                [row["id"] for row in response.data["results"]],
+                [str(pk) for pk in batch["ids"]],
+            )
+
+        self.measure(
+            "city-batch",
+            size,
+            lambda: self.client.post("/app/cities/batch/", batch, format="json"),
+            check_batch,
+        )
+
+        def check_rankings(response):
+            self.assertStatus(response, 200)
+            groups = response.data["results"]
+            self.assertEqual(len(groups), State.objects.count())
+            for group in groups:
+                self.assertLessEqual(len(group["top"]), 5)
+                self.assertEqual(group["max"], group["top"][0])
+
+        self.measure(
+            "city-rankings",
+            size,
+            lambda: get("/app/cities/rankings/?group=state&metric=avg_age&top=5"),
+            check_rankings,
+        )
+        # The in-memory index is built once; lookups never touch the database
+        autocomplete.index.build()
+
+        def check_autocomplete(response):
+            self.assertStatus(response, 200)
+            self.assertTrue(response.data["results"])
+            for result in response.data["results"]:
+                self.assertTrue(result["name"].startswith("City seed1"))
+
+        self.measure(
+            "city-autocomplete",
+            size,
+            lambda: get("/app/cities/autocomplete/?q=city%20seed1"),
+            check_autocomplete,
+            cached=True,
+        )
+
+        def check_export(response):
+            self.assertStatus(response, 200)
+            self.assertEqual(
+                response.lines[0].split(",")[:3], ["id", "name", "city_code"]
+            )
+            self.assertEqual(len(response.lines), 1 + City.objects.count())
+
+        self.measure(
+            "city-export",
+            size,
+            lambda: consume(get("/app/export/cities.csv")),
+            check_export,
+        )
+
+        post = self.client.post
+
+        def check_countries(response):
+            self.assertStatus(response, 201)
+            (created,) = response.data
+            self.assertEqual(
+                [len(state["cities"]) for state in created["states"]], [20] * 3
+            )
+
+        self.measure(
+            "country-bulk-create",
+            size,
+            lambda: post("/app/countries/", [self.nested_country()], format="json"),
+            check_countries,
+        )
+
+        def states_payload():
+            code = next(self.codes)
+            return [
+                {
+                    "name": f"Bulk State {code}-{i}",
+                    "state_code": "BS",
+                    "gst_code": f"BG{code}-{i}",
+                    "country": str(country.id),
+                    "cities": [city_data(f"s{code}-{i}-{c}") for c in range(20)],
+                }
+                for i in range(3)
+            ]
+
+        def check_states(response):
+            self.assertStatus(response, 201)
+            self.assertEqual(
+                [len(state["cities"]) for state in response.data], [20] * 3
+            )
+
+        self.measure(
+            "state-bulk-create",
+            size,
+            lambda: post("/app/states/", states_payload(), format="json"),
+            check_states,
+        )
+
+        def cities_payload():
+            code = next(self.codes)
+            return [city_data(f"c{code}-{i}", state=str(state.id)) for i in range(50)]
+
+        def check_cities(response):
+            self.assertStatus(response, 201)
+            self.assertEqual(len(response.data), 50)
+
+        self.measure(
+            "city-bulk-create",
+            size,
+            lambda: post("/app/cities/", cities_payload(), format="json"),
+            check_cities,
+        )
+
+        def ingest():
+            lines = "\n".join(json.dumps(row) for row in cities_payload())
+            return consume(
+                post("/app/cities/ingest/", lines, content_type="application/x-ndjson")
+            )
+
+        def check_ingest(response):
+            self.assertStatus(response, 200)
+            summary = json.loads(response.lines[-1])
+            self.assertEqual(summary, {"summary": {"created": 50, "failed": 0}})
+
+        self.measure("city-ingest", size, ingest, check_ingest)
+
+        upsert_rows = cities_payload()
+
+        def check_upsert(response):
+            self.assertStatus(response, 200)
+            self.assertEqual(response.data["updated"], 0)
+            self.assertEqual(response.data["created"] + response.data["unchanged"], 50)
+
+        self.measure(
+            "city-upsert",
+            size,
+            lambda: self.client.put("/app/cities/upsert/", upsert_rows, format="json"),
+            check_upsert,
+        )
+
+    def test_values_reader_matches_serializers(self):
+        """
+        Values-based list rendering is byte-identical to the serializers;
+        both are timed on the full nested tree of the largest size
+        """
+        size = max(BENCH_SIZES)
+        self.seed(size)
+        lists = [
+            (CountrySerializer, Country.objects.filter(my_user=self.user)),
+            (StateSerializer, State.objects.all()),
+            (CitySerializer, City.objects.all()),
+        ]
+        for serializer_class, queryset in lists:
+            queryset = queryset.order_by("name", "pk")
+            name = serializer_class.Meta.model._meta.model_name
+            with self.subTest(model=name):
+                self.assertEqual(
+                    render_reader(serializer_class, queryset),
+                    render_serializer(serializer_class, queryset),
+                )
+                timings = {}
+                for label, render in (
+                    ("serializer", render_serializer),
+                    ("reader", render_reader),
+                ):
+                    runs = []
+                    for _ in range(BENCH_REPEAT):
+                        started = time.perf_counter()
+                        render(serializer_class, queryset)
+                        runs.append((time.perf_counter() - started) * 1000)
+                    timings[label] = statistics.median(runs)
+                self.results[f"{name}-render@{size}"] = {
+                    "serializer_ms": round(timings["serializer"], 3),
+                    "reader_ms": round(timings["reader"], 3),
+                    "speedup": round(timings["serializer"] / timings["reader"], 2),
+                }
+
+    def compare_with_baseline(self):
+        if not BENCH_BASELINE or BENCH_RECORD or not os.path.exists(BENCH_BASELINE):
+            return
+        with open(BENCH_BASELINE) as handle:
+            baseline = json.load(handle)
+        for key, result in self.results.items():
+            if key not in baseline or "p95_ms" not in result:
+                continue
+            with self.subTest(endpoint=key):
+                self.assertLessEqual(result["queries"], baseline[key]["queries"])
+                self.assertLessEqual(
+                    result["p95_ms"],
+                    baseline[key]["p95_ms"] * (1 + BENCH_TOLERANCE),
+                    f"{key} p95 regressed against {BENCH_BASELINE}",
+                )
+
+
+# Plan steps that read a whole table or sort rows outside an index
+SLOW_PLAN_STEPS = re.compile(r"\bSCAN\b|TEMP B-TREE")
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN output is SQLite's")
+class QueryPlanTests(TestCase):
+    """
+    Hot read queries are answered from indexes, without full scans or sorts
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(email="plans@example.com")
+        self.country = Country.objects.create(
+            name="India",
+            country_code="IN",
+            curr_symbol="₹",
+            phone_code="+91",
+            my_user=self.user,
+        )
+        self.state = State.objects.create(
+            name="Gujarat", state_code="GJ", gst_code="24GJ", country=self.country
+        )
+        self.city = City.objects.create(state=self.state, **city_data("plan"))
+
+    def hot_queries(self):
+        ordering = ("-name", "-pk")
+
+        def page(queryset, row):
+            position = [row.name, str(row.pk)]
+            return queryset.filter(after(ordering, position)).order_by(*ordering)[:6]
+
+        return {
+            # Cursor pages of the list endpoints
+            "country-list": page(
+                Country.objects.filter(my_user=self.user), self.country
+            ),
+            "state-list": page(State.objects.all(), self.state),
+            # City lists read the flat records
+            "city-list": page(CityRecord.objects.all(), self.city),
+            "state-city-list": page(
+                CityRecord.objects.filter(state=self.state), self.city
+            ),
+            "country-city-list": page(
+                CityRecord.objects.filter(country=self.country), self.city
+            ),
+            # Range filters and their bounded counts
+            "state-city-range": page(
+                CityRecord.objects.filter(state=self.state, population__gte=1000),
+                self.city,
+            ),
+            "city-range": page(CityRecord.objects.filter(avg_age__lt=40), self.city),
+            "state-city-range-count": CityRecord.objects.filter(
+                state=self.state, avg_age__lt=40
+            ),
+            "city-range-count": CityRecord.objects.filter(population__gte=1000),
+            # Nested states and cities of a page
+            "country-states": State.objects.filter(country_id__in=[self.country.pk]),
+            "state-cities": City.objects.filter(state_id__in=[self.state.pk]),
+            # ETag validators
+            "user-cities": CityRecord.objects.filter(owner=self.user),
+            "country-cities": CityRecord.objects.filter(country_id=self.country.pk),
+            "state-demographics": StateDemographics.objects.filter(
+                country_id=self.country.pk
+            ),
+            "import-jobs": ImportJob.objects.filter(my_user=self.user),
+            # app/scripts/queries.py
+            "state-by-name": State.objects.filter(name="Gujarat"),
+            "state-cities-by-name": City.objects.filter(state=self.state).order_by(
+                "name"
+            ),
+            "country-states-by-name": State.objects.filter(
+                country=self.country
+            ).order_by("name"),
+            "country-name-cities": City.objects.filter(state__country__name="India"),
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertIsNone(
+                    SLOW_PLAN_STEPS.search(plan), f"{queryset.query}\n{plan}"
+                )
+
+
+class HierarchyQuerySetTests(TestCase):
+    """
+    ``with_hierarchy()`` rows print their parents without extra queries
+    """
+
+    def setUp(self):
+        user = CustomUser.objects.create(email="hierarchy@example.com")
+        country = Country.objects.create(
+            name="India",
+            country_code="IN",
+            curr_symbol="₹",
+            phone_code="+91",
+            my_user=user,
+        )
+        states = State.objects.bulk_create(
+            State(name=f"State {i}", state_code="S", gst_code=f"G{i}", country=country)
+            for i in range(3)
+        )
+        City.objects.bulk_create(
+            City(state=states[i % 3], **city_data(f"h{i}")) for i in range(9)
+        )
+
+    def test_hierarchy_reads_one_query(self):
+        with self.assertNumQueries(1):
+            cities = [
+                (str(city), city.state_name, city.country_name)
+                for city in City.objects.with_hierarchy()
+            ]
+        self.assertIn(("City h0 - State 0", "State 0", "India"), cities)
+        with self.assertNumQueries(1):
+            states = [
+                (str(state), state.country_user_name)
+                for state in State.objects.with_hierarchy()
+            ]
+        self.assertIn(("State 0 - India", "hierarchy@example.com"), states)
+
+    def test_reassigned_parent_wins_over_annotation(self):
+        city = City.objects.with_hierarchy().get(city_code="Ch0")
+        city.state = State.objects.get(gst_code="G1")
+        self.assertEqual(city.state_name, "State 1")
+
+
+@override_settings(MIDDLEWARE=API_MIDDLEWARE)
+class TokenAuthenticationTests(APITestCase):
+    """
+    Cached token authentication, and logout revoking the access and refresh
+    tokens in every process
+    """
+
+    def setUp(self):
+        # Rolled back test users never bumped the version of the user cache
+        authentication.users.clear()
+        self.user = CustomUser.objects.create(
+            email="revoke@example.com", password="secret"
+        )
+        self.tokens = self.login()
+
+    def login(self):
+        tokens = self.client.post(
+            "/api/login/",
+            {"email": "revoke@example.com", "password": "secret"},
+            format="json",
+        ).data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        return tokens
+
+    def logout(self, refresh):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/logout/", {"refresh": refresh}, format="json")
+
+    def test_authentication_needs_no_query(self):
+        self.client.get("/app/")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/app/").status_code, 200)
+
+    def test_logout_revokes_tokens(self):
+        self.assertEqual(self.logout(self.tokens["refresh"]).status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        self.assertEqual(self.client.get("/app/").status_code, 401)
+        # The refresh token is blacklisted
+        self.login()
+        self.assertEqual(self.logout(self.tokens["refresh"]).status_code, 400)
+
+    def test_other_processes_reload_after_version_bump(self):
+        self.logout(self.tokens["refresh"])
+        revocation.revoked.jtis = {}
+        revocation.revoked.version = None
+        self.assertEqual(self.client.get("/app/").status_code, 401)
+
+    def test_logout_body_must_be_an_object(self):
+        for body in [["refresh"], "refresh", 1, []]:
+            with self.subTest(body=body):
+                response = self.client.post("/api/logout/", body, format="json")
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(RevokedToken.objects.exists())
+        self.assertEqual(self.client.get("/app/").status_code, 200)
+        self.assertEqual(self.client.get("/api/logout/").status_code, 200)
+
+    def test_invalid_refresh_is_rejected(self):
+        self.assertEqual(self.logout("garbage").status_code, 400)
+        self.assertEqual(self.client.get("/app/").status_code, 200)
+
+    def test_requests_get_their_own_user(self):
+        authenticator = authentication.CachedJWTAuthentication()
+        token = authenticator.get_validated_token(self.tokens["access"].encode())
+        authenticator.get_user(token)
+        with self.assertNumQueries(0):
+            first = authenticator.get_user(token)
+            second = authenticator.get_user(token)
+        self.assertEqual(first, self.user)
+        self.assertIsNot(first, second)
+        self.assertIsNot(first._state, second._state)
+        self.assertEqual((first._state.db, first._state.adding), ("default", False))
+        first.email = "changed@example.com"
+        first._state.fields_cache["groups"] = []
+        user = authenticator.get_user(token)
+        self.assertEqual(user.email, "revoke@example.com")
+        self.assertEqual(user._state.fields_cache, {})
+
+    def test_user_writes_invalidate_cached_users(self):
+        self.client.get("/app/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = "renamed@example.com"
+            self.user.save()
+        self.assertEqual(
+            self.client.get("/app/").data["message"], "Hello, renamed@example.com!"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get("/app/").status_code, 401)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.client.get("/app/").status_code, 401)
+
+
+class BulkIngestTests(GeoAPITestCase):
+    """
+    Nested country and state payloads are validated as a whole and inserted
+    level by level, or rejected with errors aligned with the input
+    """
+
+    def test_nested_countries_are_created(self):
+        payload = [
+            country_data(
+                "IN",
+                [state_data("GJ", [city_data(1), city_data(2)]), state_data("MH")],
+            ),
+            country_data("US", [state_data("NY", [city_data(3)])]),
+        ]
+        response = self.client.post("/app/countries/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            [country["name"] for country in response.data], ["Country IN", "Country US"]
+        )
+        self.assertEqual(
+            sorted(len(state["cities"]) for state in response.data[0]["states"]), [0, 2]
+        )
+        self.assertEqual(Country.objects.filter(my_user=self.user).count(), 2)
+        self.assertEqual(State.objects.count(), 3)
+        self.assertEqual(City.objects.count(), 3)
+        self.assertEqual(CityRecord.objects.count(), 3)
+
+    def test_errors_are_aligned_with_the_input(self):
+        invalid_city = city_data(2, population=10)
+        payload = [
+            country_data("IN", [state_data("GJ", [city_data(1)])]),
+            country_data(
+                "IN",
+                [state_data("MH", [city_data(1), invalid_city])],
+                phone_code="+91",
+            ),
+        ]
+        response = self.client.post("/app/countries/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        errors = response.data[1]
+        self.assertEqual(errors["country_code"], ["Country code must be unique"])
+        self.assertEqual(errors["name"], ["Name must be unique"])
+        cities = errors["states"][0]["cities"]
+        self.assertEqual(cities[0]["city_code"], ["City code must be unique"])
+        self.assertEqual(
+            cities[1]["non_field_errors"],
+            ["Population must be greater than the sum of adult males and females"],
+        )
+        self.assertFalse(Country.objects.exists())
+        self.assertFalse(City.objects.exists())
+
+    def test_single_payload_errors_are_not_wrapped(self):
+        response = self.client.post(
+            "/app/countries/", country_data("IN", name=""), format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("name", response.data)
+
+    def test_states_need_a_known_country(self):
+        country = self.create_country()
+        payload = [
+            state_data("GJ", [city_data(1)], country=str(country.pk)),
+            state_data("MH"),
+            state_data("KA", country=str(uuid.uuid4())),
+        ]
+        response = self.client.post("/app/states/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1]["country"], ["This field is required."])
+        self.assertIn("does not exist", response.data[2]["country"][0])
+        self.assertFalse(State.objects.exists())
+
+        response = self.client.post("/app/states/", payload[:1], format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data[0]["my_country__name"], "Country IN")
+        self.assertEqual(len(response.data[0]["cities"]), 1)
+
+
+class CityBatchCreateTests(GeoAPITestCase):
+    """
+    City lists are validated together and inserted in one batch
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.state = self.create_state(self.create_country())
+        City.objects.create(state=self.state, **city_data("stored"))
+
+    def test_valid_batch_is_created(self):
+        payload = [city_data(i, state=str(self.state.pk)) for i in range(3)]
+        response = self.client.post("/app/cities/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            [city["city_code"] for city in response.data], ["C0", "C1", "C2"]
+        )
+        self.assertEqual(City.objects.filter(state=self.state).count(), 4)
+
+    def test_errors_are_reported_per_item(self):
+        state = str(self.state.pk)
+        payload = [
+            city_data(1, state=state),
+            city_data("stored", state=state),
+            city_data(1, state=state, phone_code="P9"),
+            city_data(2, state=str(uuid.uuid4())),
+        ]
+        response = self.client.post("/app/cities/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1]["city_code"], ["City code must be unique"])
+        self.assertEqual(response.data[1]["phone_code"], ["Phone code must be unique"])
+        self.assertEqual(response.data[2], {"city_code": ["City code must be unique"]})
+        self.assertIn("does not exist", response.data[3]["state"][0])
+        self.assertEqual(City.objects.count(), 1)
+
+
+class CityIngestTests(GeoAPITestCase):
+    """
+    The NDJSON feed inserts valid lines and reports every line's outcome
+    """
+
+    def ingest(self, lines):
+        response = self.client.post(
+            "/app/cities/ingest/",
+            "\n".join(lines),
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_results_per_line_and_summary(self):
+        state = str(self.create_state(self.create_country()).pk)
+        results = self.ingest(
+            [
+                json.dumps(city_data(1, state=state)),
+                "{not json",
+                "",
+                json.dumps(city_data(1, state=state)),
+                json.dumps(city_data(2, state=state)),
+            ]
+        )
+        created = City.objects.get(city_code="C1")
+        self.assertEqual(results[0], {"line": 1, "id": str(created.pk)})
+        self.assertEqual(results[1]["line"], 2)
+        self.assertTrue(results[1]["errors"][0].startswith("JSON parse error"))
+        self.assertEqual(results[2]["line"], 4)
+        self.assertEqual(
+            results[2]["errors"]["city_code"], ["City code must be unique"]
+        )
+        self.assertEqual(results[3]["line"], 5)
+        self.assertEqual(results[4], {"summary": {"created": 2, "failed": 2}})
+        self.assertEqual(City.objects.count(), 2)
+
+
+class LoadGeoCommandTests(TestCase):
+    """
+    ``manage.py load_geo`` loads dumps, reports bad rows and skips loaded ones
+    """
+
+    def setUp(self):
+        user = CustomUser.objects.create(email="load@example.com")
+        country = Country.objects.create(
+            name="India",
+            country_code="IN",
+            curr_symbol="₹",
+            phone_code="+91",
+            my_user=user,
+        )
+        State.objects.create(
+            name="Gujarat", state_code="GJ", gst_code="24GJ", country=country
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cities.jsonl")
+        rows = [
+            city_data(1, gst_code="24GJ"),
+            city_data(2, gst_code="99XX"),
+            city_data(3),
+            city_data(4, gst_code="24GJ"),
+        ]
+        with open(self.path, "w") as handle:
+            handle.writelines(json.dumps(row) + "\n" for row in rows)
+
+    def load(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command(
+            "load_geo", "cities", self.path, workers=0, stdout=stdout, stderr=stderr
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_load_and_reload(self):
+        stdout, stderr = self.load()
+        self.assertIn("Created 2, skipped 0 existing, failed 2", stdout)
+        self.assertIn('line 2: {"gst_code": ["\\"99XX\\" does not exist."]}', stderr)
+        self.assertIn('line 3: {"gst_code": ["This field is required."]}', stderr)
+        self.assertEqual(
+            sorted(City.objects.values_list("city_code", flat=True)), ["C1", "C4"]
+        )
+        self.assertEqual(StateDemographics.objects.get().city_count, 2)
+        self.assertEqual(CityRecord.objects.count(), 2)
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+        stdout, _ = self.load()
+        self.assertIn("Created 0, skipped 2 existing, failed 2", stdout)
+        self.assertEqual(City.objects.count(), 2)
+
+    def test_loaded_names_are_indexed(self):
+        autocomplete.index.build()
+        version = cache.get(autocomplete.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.load()
+        # Other processes see the new names through the version
+        self.assertEqual(cache.get(autocomplete.VERSION_KEY), version + 1)
+        owner = CustomUser.objects.get(email="load@example.com")
+        self.assertEqual(
+            [entry.name for _, entry in autocomplete.index.search(owner.pk, "city")],
+            ["City 1", "City 4"],
+        )
+
+
+class ImportJobTests(GeoAPITestCase):
+    """
+    Asynchronous country imports keep every valid row and report the rest
+    """
+
+    def test_async_import(self):
+        payload = [
+            # Fails for its city; the second country may still take its codes
+            country_data("IN", [state_data("GJ", [city_data(1, population=1)])]),
+            country_data("IN", [state_data("GJ", [city_data(1)])], phone_code="+91"),
+            country_data("US", [state_data("NY", [city_data(1)])]),
+            country_data("FR", name=""),
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                "/app/countries/?async=true", payload, format="json"
+            )
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data["status"], "pending")
+        self.assertEqual(response.data["total_rows"], 4)
+        self.assertTrue(
+            response["Location"].endswith(f"/app/jobs/{response.data['id']}/")
+        )
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Country.objects.exists())
+
+        # What the worker pool runs once the job is committed
+        call_command("run_import_jobs", stdout=io.StringIO())
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(job["processed_rows"], 4)
+        self.assertEqual(job["failed_rows"], 3)
+        self.assertEqual(
+            job["created_counts"], {"countries": 1, "states": 1, "cities": 1}
+        )
+        self.assertEqual(sorted(job["errors"]), ["0", "2", "3"])
+        self.assertIn("non_field_errors", job["errors"]["0"]["states"][0]["cities"][0])
+        self.assertEqual(
+            job["errors"]["2"]["states"][0]["cities"][0]["city_code"],
+            ["City code must be unique"],
+        )
+        self.assertIn("name", job["errors"]["3"])
+        country = Country.objects.get()
+        self.assertEqual((country.country_code, country.phone_code), ("IN", "+91"))
+
+    def abandoned_job(self, minutes):
+        """
+        A job whose worker committed the first of three countries and went
+        quiet ``minutes`` ago
+        """
+        payload = [country_data(code) for code in ("IN", "US", "FR")]
+        with self.captureOnCommitCallbacks():
+            GeoIngest().ingest_valid(
+                payload[:1], COUNTRY_LEVELS, [self.user], "my_user"
+            )
+        job = ImportJob.objects.create(
+            my_user=self.user,
+            payload=payload,
+            total_rows=3,
+            status=ImportJob.Status.RUNNING,
+            processed_rows=1,
+            created_counts={"countries": 1, "states": 0, "cities": 0},
+        )
+        ImportJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=minutes)
+        )
+        return job
+
+    @mock.patch("app.jobs.JOB_CHUNK_SIZE", 1)
+    def test_abandoned_jobs_resume(self):
+        job = self.abandoned_job(minutes=60)
+        call_command("run_import_jobs", stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.COMPLETED)
+        self.assertEqual((job.processed_rows, job.failed_rows), (3, 0))
+        self.assertEqual(job.created_counts, {"countries": 3, "states": 0, "cities": 0})
+        self.assertEqual(
+            sorted(Country.objects.values_list("country_code", flat=True)),
+            ["FR", "IN", "US"],
+        )
+
+    def test_running_jobs_are_left_alone(self):
+        job = self.abandoned_job(minutes=1)
+        call_command("run_import_jobs", stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows), ("running", 1))
+        self.assertEqual(Country.objects.count(), 1)
+
+    @mock.patch("app.jobs.JOB_CHUNK_SIZE", 1)
+    def test_lost_jobs_stop(self):
+        job = self.abandoned_job(minutes=60)
+        ingest_valid = GeoIngest.ingest_valid
+
+        def taken_over(ingest, *args, **kwargs):
+            # Another worker commits the same chunk meanwhile
+            ImportJob.objects.filter(pk=job.pk).update(processed_rows=2)
+            return ingest_valid(ingest, *args, **kwargs)
+
+        with mock.patch.object(GeoIngest, "ingest_valid", taken_over):
+            with self.assertLogs("app.jobs", "WARNING"):
+                jobs.run_job(job.pk)
+        # Not failed, and the chunk was rolled back (along with the simulated
+        # takeover, which shares the test's connection)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.RUNNING)
+        self.assertEqual(Country.objects.count(), 1)
+
+    def test_jobs_of_other_users_are_hidden(self):
+        other = CustomUser.objects.create(email="other@example.com")
+        job = ImportJob.objects.create(my_user=other, payload=[])
+        self.assertEqual(self.client.get(f"/app/jobs/{job.pk}/").status_code, 404)
+
+
+class IngestValidTests(TestCase):
+    """
+    Batches skip the rows that fail as if they were inserted one by one
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(email="valid@example.com")
+
+    def ingest(self, rows):
+        return GeoIngest().ingest_valid(
+            rows, COUNTRY_LEVELS, [self.user] * len(rows), "my_user"
+        )
+
+    def test_repeats_of_skipped_rows_are_kept(self):
+        rows = [
+            country_data("IN", [state_data("GJ")], curr_symbol=""),
+            # Repeats the skipped first row only
+            country_data("IN", [state_data("GJ")], phone_code="+91"),
+            # Repeats the kept second row
+            country_data("US", phone_code="+91"),
+            # Repeats the skipped third row only
+            country_data("FR", phone_code="+IN", name="Country US"),
+        ]
+        created, errors = self.ingest(rows)
+        self.assertIn("curr_symbol", errors[0])
+        self.assertEqual(errors[1], {})
+        self.assertEqual(errors[2], {"phone_code": ["Phone code must be unique"]})
+        self.assertEqual(errors[3], {})
+        self.assertEqual([country.country_code for country in created[0]], ["IN", "FR"])
+        self.assertEqual(State.objects.get().country.country_code, "IN")
+
+
+class BulkUpsertTests(GeoAPITestCase):
+    """
+    Upserts report what happened to every row and keep the rollups exact
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.state = self.create_state(self.create_country())
+        City.objects.create(state=self.state, **city_data(1))
+        City.objects.create(state=self.state, **city_data(2))
+
+    def upsert(self, rows):
+        rows = [{**row, "state": str(self.state.pk)} for row in rows]
+        return self.client.put("/app/cities/upsert/", rows, format="json")
+
+    def test_statuses_and_rollups(self):
+        response = self.upsert(
+            [city_data(1), city_data(2, population=2000), city_data(3)]
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [row["status"] for row in response.data["results"]],
+            ["unchanged", "updated", "created"],
+        )
+        self.assertEqual(
+            (
+                response.data["created"],
+                response.data["updated"],
+                response.data["unchanged"],
+            ),
+            (1, 1, 1),
+        )
+        self.assertEqual(
+            response.data["results"][1]["id"], City.objects.get(city_code="C2").pk
+        )
+        rollup = StateDemographics.objects.get(state=self.state)
+        self.assertEqual((rollup.city_count, rollup.population), (3, 4000))
+        self.assertEqual(CityRecord.objects.get(city_code="C2").population, 2000)
+
+    def test_rows_inserted_concurrently_are_updated(self):
+        insert_new = GeoIngest.insert_new
+
+        def racing(ingest, *args):
+            # Another request inserts the row after the lookup missed it
+            City.objects.create(state=self.state, **city_data(3))
+            return insert_new(ingest, *args)
+
+        with mock.patch.object(GeoIngest, "insert_new", racing):
+            response = self.upsert([city_data(3, population=5000), city_data(4)])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [row["status"] for row in response.data["results"]], ["updated", "created"]
+        )
+        city = City.objects.get(city_code="C3")
+        self.assertEqual(response.data["results"][0]["id"], city.pk)
+        self.assertEqual(city.population, 5000)
+        rollup = StateDemographics.objects.get(state=self.state)
+        self.assertEqual((rollup.city_count, rollup.population), (4, 8000))
+
+    def test_lost_race_on_another_unique_field_is_rejected(self):
+        insert_new = GeoIngest.insert_new
+
+        def racing(ingest, *args):
+            City.objects.create(state=self.state, **city_data(9, phone_code="P3"))
+            return insert_new(ingest, *args)
+
+        with mock.patch.object(GeoIngest, "insert_new", racing):
+            response = self.upsert([city_data(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data[0], {"phone_code": ["Phone code must be unique"]}
+        )
+        self.assertFalse(City.objects.filter(city_code="C3").exists())
+
+
+class GeoCacheInvalidationTests(GeoAPITestCase):
+    """
+    Writes invalidate the cached responses; deletes cascade without loading
+    the cities of a deleted state or country
+    """
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country = self.create_country()
+            self.state = self.create_state(self.country)
+            self.cities = [
+                City.objects.create(state=self.state, **city_data(i)) for i in range(3)
+            ]
+
+    def get_states(self):
+        response = self.client.get(f"/app/countries/{self.country.pk}/")
+        self.assertEqual(response.status_code, 200)
+        return {
+            state["name"]: [city["city_code"] for city in state["cities"]]
+            for state in response.data["states"]
+        }
+
+    def test_writes_invalidate_cached_responses(self):
+        self.assertEqual(self.get_states(), {"State GJ": ["C0", "C1", "C2"]})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_state(self.country, "MH")
+        self.assertEqual(
+            self.get_states(), {"State GJ": ["C0", "C1", "C2"], "State MH": []}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"/app/cities/{self.cities[0].pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_states(), {"State GJ": ["C1", "C2"], "State MH": []})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.state.delete()
+        self.assertEqual(self.get_states(), {"State MH": []})
+
+    def test_city_deletes_keep_derived_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cities[0].delete()
+            City.objects.filter(pk=self.cities[1].pk).delete()
+        rollup = StateDemographics.objects.get(state=self.state)
+        self.assertEqual((rollup.city_count, rollup.population), (1, 1000))
+        self.assertEqual(
+            list(CityRecord.objects.values_list("pk", flat=True)), [self.cities[2].pk]
+        )
+
+    def test_country_delete_does_not_load_cities(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.country.delete()
+        city_reads = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and '"app_city"' in query["sql"]
+        ]
+        self.assertEqual(city_reads, [])
+        self.assertFalse(City.objects.exists())
+        self.assertFalse(CityRecord.objects.exists())
+        self.assertFalse(StateDemographics.objects.exists())
+
+
+class ConditionalGetTests(GeoAPITestCase):
+    """
+    Unchanged geo responses are answered with 304 Not Modified
+    """
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country = self.create_country()
+            self.state = self.create_state(self.country)
+
+    def get(self, url, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def test_not_modified_until_a_write(self):
+        for url in [
+            "/app/countries/",
+            f"/app/countries/{self.country.pk}/",
+            "/app/states/",
+            f"/app/states/{self.state.pk}/",
+        ]:
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response["ETag"]
+                self.assertIn("Last-Modified", response)
+                response = self.get(url, etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    City.objects.create(state=self.state, **city_data(url))
+                response = self.get(url, etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_owner_changes_change_the_etag(self):
+        url = f"/app/countries/{self.country.pk}/"
+        etag = self.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = "renamed@example.com"
+            self.user.save()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["my_user_name"], "renamed@example.com")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_missing_rows_are_not_validated(self):
+        response = self.get(f"/app/cities/{uuid.uuid4()}/", '"anything"')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response)
+
+
+class DemographicsTests(GeoAPITestCase):
+    """
+    Rollups follow every city and state write and match a rebuild
+    """
+
+    COUNTERS = ["city_count", "population", "num_of_adult_males"]
+
+    def setUp(self):
+        super().setUp()
+        self.india = self.create_country()
+        self.nepal = self.create_country("NP")
+        self.gujarat = self.create_state(self.india)
+        self.kerala = self.create_state(self.india, "KL")
+
+    def totals(self, kind, pk):
+        response = self.client.get(f"/app/{kind}/{pk}/demographics/")
+        self.assertEqual(response.status_code, 200)
+        return [response.data[counter] for counter in self.COUNTERS]
+
+    def assertTotals(self, kind, pk, expected):
+        self.assertEqual(self.totals(kind, pk), expected)
+
+    def assertRebuilt(self):
+        """
+        Incremental rollups equal the ones recomputed from the City table
+        """
+        parents = [
+            ("countries", self.india.pk),
+            ("countries", self.nepal.pk),
+            ("states", self.gujarat.pk),
+            ("states", self.kerala.pk),
+        ]
+        stored = [self.totals(*parent) for parent in parents]
+        call_command("rebuild_demographics", stdout=io.StringIO())
+        self.assertEqual([self.totals(*parent) for parent in parents], stored)
+
+    def create_city(self, state, code, **extra):
+        response = self.client.post(
+            "/app/cities/",
+            {"state": state.pk, **city_data(code, **extra)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def test_city_writes(self):
+        self.assertTotals("countries", self.india.pk, [0, 0, 0])
+        ahmedabad = self.create_city(self.gujarat, "AMD")
+        self.create_city(self.kerala, "KOC", population=500, num_of_adult_males=100)
+        self.assertTotals("states", self.gujarat.pk, [1, 1000, 300])
+        self.assertTotals("countries", self.india.pk, [2, 1500, 400])
+
+        # City updates go through the model: the serializer validates the
+        # whole row and its own codes as new
+        city = City.objects.get(pk=ahmedabad)
+        city.population, city.num_of_adult_males = 4000, 1000
+        city.save()
+        self.assertTotals("states", self.gujarat.pk, [1, 4000, 1000])
+        self.assertTotals("countries", self.india.pk, [2, 4500, 1100])
+
+        city.state = self.kerala
+        city.save()
+        self.assertTotals("states", self.gujarat.pk, [0, 0, 0])
+        self.assertTotals("states", self.kerala.pk, [2, 4500, 1100])
+        self.assertTotals("countries", self.india.pk, [2, 4500, 1100])
+        self.assertRebuilt()
+
+        response = self.client.delete(f"/app/cities/{ahmedabad}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertTotals("states", self.kerala.pk, [1, 500, 100])
+        self.assertTotals("countries", self.india.pk, [1, 500, 100])
+        self.assertRebuilt()
+
+    def test_state_moves_and_deletes(self):
+        self.create_city(self.gujarat, "AMD")
+        self.create_city(self.kerala, "KOC", population=500, num_of_adult_males=100)
+
+        self.kerala.country = self.nepal
+        self.kerala.save()
+        self.assertTotals("countries", self.india.pk, [1, 1000, 300])
+        self.assertTotals("countries", self.nepal.pk, [1, 500, 100])
+        self.assertTotals("states", self.kerala.pk, [1, 500, 100])
+        self.assertRebuilt()
+
+        response = self.client.delete(f"/app/states/{self.gujarat.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertTotals("countries", self.india.pk, [0, 0, 0])
+        self.assertTotals("countries", self.nepal.pk, [1, 500, 100])
+
+    def test_bulk_writes(self):
+        self.client.post(
+            "/app/cities/",
+            [{"state": self.gujarat.pk, **city_data(code)} for code in "ABC"],
+            format="json",
+        )
+        self.assertTotals("countries", self.india.pk, [3, 3000, 900])
+        City.objects.filter(city_code__in=["CA", "CB"]).delete()
+        self.assertTotals("states", self.gujarat.pk, [1, 1000, 300])
+        self.assertTotals("countries", self.india.pk, [1, 1000, 300])
+        self.assertRebuilt()
+
+
+class CityRankingTests(GeoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        india = self.create_country()
+        gujarat = self.create_state(india)
+        kerala = self.create_state(india, "KL")
+        for state, code, population, avg_age in [
+            (gujarat, "AMD", 5000, 30.0),
+            (gujarat, "SRT", 3000, 35.0),
+            (gujarat, "RJK", 1000, 28.0),
+            (kerala, "KOC", 2000, 40.0),
+        ]:
+            City.objects.create(
+                state=state,
+                **city_data(code, population=population, avg_age=avg_age),
+            )
+        other = CustomUser.objects.create(email="other@example.com")
+        nepal = self.create_state(self.create_country("NP", user=other), "BA")
+        City.objects.create(state=nepal, **city_data("KTM", population=9000))
+
+    def rankings(self, **params):
+        response = self.client.get("/app/cities/rankings/", params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            group["name"]: (
+                [city["city_code"] for city in group["top"]],
+                group["min"]["city_code"],
+                group["max"]["city_code"],
+            )
+            for group in response.data["results"]
+        }
+
+    def test_groups_and_metrics(self):
+        self.assertEqual(
+            self.rankings(top=2),
+            {"Country IN": (["CAMD", "CSRT"], "CRJK", "CAMD")},
+        )
+        self.assertEqual(
+            self.rankings(group="state", metric="avg_age", top=2),
+            {
+                "State GJ": (["CSRT", "CAMD"], "CRJK", "CSRT"),
+                "State KL": (["CKOC"], "CKOC", "CKOC"),
+            },
+        )
+
+    def test_metric_values(self):
+        response = self.client.get("/app/cities/rankings/", {"top": 1})
+        (country,) = response.data["results"]
+        self.assertEqual(country["top"], [country["max"]])
+        self.assertEqual(country["max"]["population"], 5000)
+        self.assertEqual(country["min"]["population"], 1000)
+
+    def test_invalid_parameters(self):
+        response = self.client.get(
+            "/app/cities/rankings/", {"group": "city", "metric": "area", "top": 0}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {"group", "metric", "top"})
+        response = self.client.get("/app/cities/rankings/", {"top": "many"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {"top"})
+
+
+class GeoExportTests(GeoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.india = self.create_country()
+        self.gujarat = self.create_state(self.india)
+        self.kerala = self.create_state(self.create_country("NP"), "BA")
+        for state, code in [(self.gujarat, "AMD"), (self.gujarat, "SRT")]:
+            City.objects.create(state=state, **city_data(code))
+        City.objects.create(state=self.kerala, **city_data("KTM", population=9000))
+        other = CustomUser.objects.create(email="other@example.com")
+        hidden = self.create_state(self.create_country("LK", user=other), "WP")
+        City.objects.create(state=hidden, **city_data("CMB"))
+
+    def export(self, path, **params):
+        response = consume(self.client.get(f"/app/export/{path}", params))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_csv(self):
+        response = self.export("cities.csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="cities.csv"'
+        )
+        rows = list(csv.DictReader(response.lines))
+        self.assertEqual(
+            list(rows[0]), [column for column, _ in export.EXPORTS["cities"][1]]
+        )
+        cities = City.objects.exclude(city_code="CCMB").order_by("pk")
+        self.assertEqual([row["id"] for row in rows], [str(city.pk) for city in cities])
+        ktm = next(row for row in rows if row["city_code"] == "CKTM")
+        self.assertEqual(ktm["population"], "9000")
+        self.assertEqual(ktm["avg_age"], "31.5")
+        self.assertEqual(ktm["state"], str(self.kerala.pk))
+        self.assertEqual(ktm["gst_code"], "GBA")
+
+        response = self.export("cities.csv", country_code="IN")
+        self.assertEqual(
+            sorted(row["city_code"] for row in csv.DictReader(response.lines)),
+            ["CAMD", "CSRT"],
+        )
+
+    def test_jsonl(self):
+        response = self.export("states.jsonl")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in response.lines]
+        self.assertEqual(
+            sorted((row["gst_code"], row["country_code"]) for row in rows),
+            [("GBA", "NP"), ("GGJ", "IN")],
+        )
+        gujarat = next(row for row in rows if row["gst_code"] == "GGJ")
+        self.assertEqual(gujarat["country"], str(self.india.pk))
+        self.assertEqual(gujarat["name"], "State GJ")
+
+        rows = self.export("countries.jsonl", country_code="NP").lines
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(json.loads(rows[0])["owner"], "geo@example.com")
+
+    def test_export_loads_back(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "cities.csv")
+        call_command(
+            "export_geo", "cities", output=path, country_code="IN", stderr=io.StringIO()
+        )
+        exported = sorted(
+            City.objects.filter(state=self.gujarat).values_list(
+                "city_code", "phone_code", "population", "state_id"
+            )
+        )
+        City.objects.filter(state=self.gujarat).delete()
+
+        call_command("load_geo", "cities", path, workers=0, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(
+                City.objects.filter(state=self.gujarat).values_list(
+                    "city_code", "phone_code", "population", "state_id"
+                )
+            ),
+            exported,
+        )
+
+
+class FieldsetTests(GeoAPITestCase):
+    """
+    ``?fields=`` and ``?expand=`` shape the response and the queries
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.country = self.create_country()
+        self.state = self.create_state(self.country)
+        City.objects.create(state=self.state, **city_data("AMD"))
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_default_shape(self):
+        (country,) = self.get("/app/countries/")["results"]
+        self.assertIn("my_user_name", country)
+        (state,) = country["states"]
+        self.assertIn("my_country__name", state)
+        self.assertEqual(state["cities"][0]["city_code"], "CAMD")
+
+    def test_fields(self):
+        # The ETag validators and the page, without prefetches
+        with self.assertNumQueries(2):
+            page = self.get("/app/countries/", fields="name,country_code")
+        self.assertEqual(
+            page["results"], [{"name": "Country IN", "country_code": "IN"}]
+        )
+        state = self.get(
+            f"/app/states/{self.state.pk}/", fields="name,my_country__name"
+        )
+        self.assertEqual(state, {"name": "State GJ", "my_country__name": "Country IN"})
+
+    def test_nested_fields(self):
+        page = self.get("/app/countries/", fields="name,states.name,states.cities.name")
+        self.assertEqual(
+            page["results"],
+            [
+                {
+                    "name": "Country IN",
+                    "states": [{"name": "State GJ", "cities": [{"name": "City AMD"}]}],
+                }
+            ],
+        )
+        (state,) = self.get("/app/states/", fields="name,cities.city_code")["results"]
+        self.assertEqual(state, {"name": "State GJ", "cities": [{"city_code": "CAMD"}]})
+
+    def test_expand(self):
+        (country,) = self.get("/app/countries/", expand="states")["results"]
+        self.assertIn("my_user_name", country)
+        (state,) = country["states"]
+        self.assertEqual(state["gst_code"], "GGJ")
+        self.assertNotIn("cities", state)
+
+        (country,) = self.get("/app/countries/", expand="states.cities")["results"]
+        self.assertEqual(country["states"][0]["cities"][0]["city_code"], "CAMD")
+
+        (country,) = self.get("/app/countries/", fields="name")["results"]
+        self.assertEqual(country, {"name": "Country IN"})
+
+    def test_batch(self):
+        response = self.client.get(
+            "/app/states/batch/", {"ids": str(self.state.pk), "fields": "gst_code"}
+        )
+        self.assertEqual(response.data["results"], [{"gst_code": "GGJ"}])
+
+
+class PaginationTests(GeoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        state = self.create_state(self.create_country())
+        # Four names shared by three cities each, so pages split the ties
+        for index in range(12):
+            City.objects.create(
+                state=state, **city_data(index, name=f"City {index % 4}")
+            )
+        self.expected = [
+            str(pk)
+            for pk in City.objects.order_by("-name", "-pk").values_list("pk", flat=True)
+        ]
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([str(row["id"]) for row in response.data["results"]])
+            url = response.data[link]
+        return pages
+
+    def test_ties_across_pages(self):
+        pages = self.walk("/app/cities/?page_size=5", "next")
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_walk_back(self):
+        url = "/app/cities/?page_size=5"
+        for _ in range(2):
+            url = self.client.get(url).data["next"]
+        back = self.walk(url, "previous")
+        self.assertEqual(sum(reversed(back), []), self.expected)
+
+    def test_page_size(self):
+        response = self.client.get("/app/cities/")
+        self.assertEqual(len(response.data["results"]), ModelPagination.page_size)
+        response = self.client.get("/app/cities/", {"page_size": 12})
+        self.assertEqual(len(response.data["results"]), 12)
+        self.assertIsNone(response.data["next"])
+
+        Country.objects.bulk_create(
+            Country(
+                name=f"Country {index}",
+                country_code=f"K{index}",
+                curr_symbol="$",
+                phone_code=f"+{index}",
+                my_user=self.user,
+            )
+            for index in range(ModelPagination.max_page_size + 5)
+        )
+        response = self.client.get("/app/countries/", {"page_size": 1000})
+        self.assertEqual(len(response.data["results"]), ModelPagination.max_page_size)
+        self.assertIsNotNone(response.data["next"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/app/cities/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+
+class AutocompleteTests(GeoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.country = self.create_country()
+        self.state = self.create_state(self.country)
+        self.city = City.objects.create(
+            state=self.state, **city_data("NYC", name="New York")
+        )
+        City.objects.create(state=self.state, **city_data("YRK", name="York"))
+        City.objects.create(state=self.state, **city_data("SAO", name="São Paulo"))
+        other = CustomUser.objects.create(email="other@example.com")
+        hidden = self.create_state(self.create_country("GB", user=other), "EN")
+        City.objects.create(state=hidden, **city_data("NCL", name="Newcastle"))
+        autocomplete.index.build()
+
+    def names(self, query):
+        response = self.client.get("/app/cities/autocomplete/", {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [result["name"] for result in response.data["results"]]
+
+    def version(self):
+        return cache.get(autocomplete.VERSION_KEY)
+
+    def test_prefix(self):
+        self.assertEqual(self.names("new"), ["New York"])
+        # Whole names rank before later words
+        self.assertEqual(self.names("york"), ["York", "New York"])
+        self.assertEqual(self.names("ork"), [])
+        response = self.client.get("/app/cities/autocomplete/", {"q": "new y"})
+        self.assertEqual(
+            response.data["results"],
+            [
+                {
+                    "id": self.city.pk,
+                    "type": "city",
+                    "name": "New York",
+                    "state": "State GJ",
+                    "country": "Country IN",
+                }
+            ],
+        )
+
+    def test_accent_folding(self):
+        self.assertEqual(self.names("sao"), ["São Paulo"])
+        self.assertEqual(self.names("SÃO  PAU"), ["São Paulo"])
+        self.assertEqual(self.names("paulo"), ["São Paulo"])
+
+    def test_owner_scoping(self):
+        self.assertNotIn("Newcastle", self.names("new"))
+        self.assertEqual(self.names("country"), ["Country IN"])
+        self.client.force_authenticate(
+            CustomUser.objects.get(email="other@example.com")
+        )
+        self.assertEqual(self.names("new"), ["Newcastle"])
+
+    def test_invalid_parameters(self):
+        response = self.client.get(
+            "/app/cities/autocomplete/", {"q": " ", "limit": 100}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {"q", "limit"})
+
+    def test_writes(self):
+        version = self.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.city.population = 5000
+            self.city.save()
+        # Writes that keep the names do not make other processes rebuild
+        self.assertEqual(self.version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.city.name = "Newark"
+            self.city.save()
+        self.assertEqual(self.version(), version + 1)
+        self.assertEqual(autocomplete.index.version, version + 1)
+        self.assertEqual(self.names("new"), ["Newark"])
+        self.assertEqual(self.names("york"), ["York"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.state.delete()
+        self.assertEqual(self.names("new"), [])
+        self.assertEqual(self.names("country"), ["Country IN"])
+
+    def test_bulk_created_cities(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/app/cities/",
+                [
+                    {"state": self.state.pk, **city_data(code, name=name)}
+                    for code, name in [("KOC", "Kochi"), ("KOL", "Kolkata")]
+                ],
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.names("ko"), ["Kochi", "Kolkata"])
+
+    def test_foreign_writes(self):
+        # Another process indexed a name in between
+        cache.incr(autocomplete.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.city.name = "Newark"
+            self.city.save()
+        # The stale index keeps serving, with the local writes, until rebuilt
+        with mock.patch.object(autocomplete.index, "rebuild_in_background") as rebuild:
+            self.assertEqual(self.names("new"), ["Newark"])
+        rebuild.assert_called_once_with()
+
+
+class ParentReferenceTests(GeoAPITestCase):
+    """
+    States and cities name their parent by id or by natural key
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.india = self.create_country()
+        self.nepal = self.create_country("NP")
+        self.gujarat = self.create_state(self.india)
+
+    def post(self, url, data):
+        return self.client.post(url, data, format="json")
+
+    def test_state_by_country_code(self):
+        response = self.post("/app/states/", state_data("KL", country_code="IN"))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["country"], self.india.pk)
+        self.assertNotIn("country_code", response.data)
+
+        response = self.post("/app/states/", state_data("MH", country=self.india.pk))
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.patch(
+            f"/app/states/{self.gujarat.pk}/", {"country_code": "NP"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.gujarat.refresh_from_db()
+        self.assertEqual(self.gujarat.country_id, self.nepal.pk)
+
+    def test_state_errors(self):
+        response = self.post("/app/states/", state_data("KL"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"country": ["This field is required."]})
+
+        response = self.post("/app/states/", state_data("KL", country_code="XX"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data,
+            {"country_code": ["Object with country_code=XX does not exist."]},
+        )
+
+        response = self.post(
+            "/app/states/", state_data("KL", country=str(uuid.uuid4()))
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("country", response.data)
+
+        response = self.post(
+            "/app/states/",
+            state_data("KL", name="State GJ", country_code="IN"),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data,
+            {"non_field_errors": ["The fields country, name must make a unique set."]},
+        )
+        self.assertFalse(State.objects.filter(state_code="KL").exists())
+
+    def test_city_by_gst_code(self):
+        response = self.post("/app/cities/", city_data("AMD", gst_code="GGJ"))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["state"], self.gujarat.pk)
+
+        for gst_code, error in [
+            ("G99", "Object with gst_code=G99 does not exist."),
+            (24, "Incorrect type. Expected pk value, received int."),
+        ]:
+            response = self.post("/app/cities/", city_data("SRT", gst_code=gst_code))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data, {"gst_code": [error]})
+
+        response = self.post("/app/cities/", city_data("SRT"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"state": ["This field is required."]})
+
+    def test_codes_are_cached_until_a_parent_changes(self):
+        self.post("/app/cities/", city_data("AMD", gst_code="GGJ"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post("/app/cities/", city_data("SRT", gst_code="GGJ"))
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(
+            [query for query in queries if 'FROM "app_state"' in query["sql"]]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gujarat.gst_code = "G24"
+            self.gujarat.save()
+        response = self.post("/app/cities/", city_data("RJK", gst_code="GGJ"))
+        self.assertEqual(response.status_code, 400)
+        response = self.post("/app/cities/", city_data("RJK", gst_code="G24"))
+        self.assertEqual(response.status_code, 201)
+
+    def test_bulk_codes(self):
+        response = self.client.put(
+            "/app/cities/upsert/",
+            [city_data("AMD", gst_code="GGJ"), city_data("KTM", gst_code="G99")],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data,
+            [{}, {"gst_code": ["Object with gst_code=G99 does not exist."]}],
+        )
+        response = self.client.put(
+            "/app/states/upsert/",
+            [state_data("KL", country_code="IN"), state_data("BA", country_code="NP")],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(State.objects.values_list("gst_code", "country__country_code")),
+            {"GGJ": "IN", "GKL": "IN", "GBA": "NP"},
+        )
+
+
+class SchemaTests(GeoAPITestCase):
+    def test_city_list_filters(self):
+        response = self.client.get("/api/schema/", {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        schema = json.loads(response.content)
+        parameters = {
+            parameter["name"]
+            for parameter in schema["paths"]["/app/cities/"]["get"]["parameters"]
+        }
+        self.assertLessEqual(
+            {"state", "country", "population__gte", "avg_age__lt", "page_size"},
+            parameters,
+        )
+        self.assertNotIn("country__gte", parameters)
+
+    def test_cached_jwt_authentication(self):
+        response = self.client.get("/api/schema/", {"format": "json"})
+        schema = json.loads(response.content)
+        self.assertEqual(
+            schema["components"]["securitySchemes"]["jwtAuth"],
+            {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"},
+        )
+        self.assertEqual(
+            schema["paths"]["/app/cities/"]["get"]["security"], [{"jwtAuth": []}]
+        )
+
+
+class BatchRetrieveTests(GeoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        state = self.create_state(self.create_country())
+        self.cities = [
+            City.objects.create(state=state, **city_data(code)) for code in "ABC"
+        ]
+
+    def test_request_order_and_markers(self):
+        a, b, c = (str(city.pk) for city in self.cities)
+        unknown = str(uuid.uuid4())
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                "/app/cities/batch/", {"ids": [c, unknown, a, c]}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([row.get("id") for row in results], [c, unknown, a, c])
+        self.assertEqual(results[1], {"id": unknown, "detail": "Not found."})
+        self.assertEqual(results[0]["city_code"], "CC")
+
+        response = self.client.get("/app/cities/batch/", {"codes": "CB,CX,CA"})
+        self.assertEqual(
+            [row["city_code"] for row in response.data["results"]], ["CB", "CX", "CA"]
+        )
+        self.assertEqual(
+            response.data["results"][1], {"city_code": "CX", "detail": "Not found."}
+        )
+
+    def test_states(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                "/app/states/batch/", {"codes": "GX,GGJ", "expand": "cities"}
+            )
+        missing, state = response.data["results"]
+        self.assertEqual(missing, {"gst_code": "GX", "detail": "Not found."})
+        self.assertEqual(
+            [city["city_code"] for city in state["cities"]], ["CA", "CB", "CC"]
+        )
+
+    def test_input_limit(self):
+        ids = [str(uuid.uuid4()) for _ in range(MAX_BATCH_SIZE + 1)]
+        response = self.client.post(
+            "/app/cities/batch/", {"ids": ids[:-1]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), MAX_BATCH_SIZE)
+        response = self.client.post("/app/cities/batch/", {"ids": ids}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), ["ids"])
+
+    def test_invalid_lookups(self):
+        for data in [
+            {},
+            {"ids": [str(self.cities[0].pk)], "codes": ["CA"]},
+            {"ids": []},
+            {"ids": ["not-a-uuid"]},
+        ]:
+            with self.subTest(data=data):
+                response = self.client.post("/app/cities/batch/", data, format="json")
+                self.assertEqual(response.status_code, 400)
+
+
+class CityRecordTests(GeoAPITestCase):
+    """
+    Flat city records follow writes to the cities and all their parents
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.india = self.create_country()
+        self.nepal = self.create_country("NP")
+        self.gujarat = self.create_state(self.india)
+        self.kerala = self.create_state(self.india, "KL")
+        for state, code in [(self.gujarat, "AMD"), (self.kerala, "KOC")]:
+            City.objects.create(state=state, **city_data(code))
+
+    def assertSynced(self):
+        """
+        Stored records equal the ones rebuilt from the City table
+        """
+        columns = [*records.CITY_COLUMNS, *records.CITY_PARENT_COLUMNS]
+        self.assertEqual(
+            list(CityRecord.objects.order_by("pk").values(*columns)),
+            list(records.city_rows(City.objects.order_by("pk"))),
+        )
+
+    def record(self, code):
+        return CityRecord.objects.get(city_code=f"C{code}")
+
+    def test_parent_renames(self):
+        response = self.client.patch(
+            f"/app/states/{self.gujarat.pk}/",
+            {"name": "Gujarat", "gst_code": "G24"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.record("AMD").state_name, "Gujarat")
+        self.assertEqual(self.record("AMD").gst_code, "G24")
+
+        response = self.client.patch(
+            f"/app/countries/{self.india.pk}/",
+            {"name": "India", "country_code": "IND"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(CityRecord.objects.values_list("country_name", "country_code")),
+            [("India", "IND"), ("India", "IND")],
+        )
+        self.assertSynced()
+
+        response = self.client.get("/app/cities/", {"country": self.india.pk})
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_state_moves(self):
+        response = self.client.patch(
+            f"/app/states/{self.kerala.pk}/", {"country_code": "NP"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.record("KOC").country_id, self.nepal.pk)
+        self.assertEqual(self.record("KOC").country_name, "Country NP")
+        self.assertSynced()
+
+        response = self.client.get("/app/cities/", {"country": self.nepal.pk})
+        self.assertEqual(
+            [row["city_code"] for row in response.data["results"]], ["CKOC"]
+        )
+
+    def test_upserted_parents(self):
+        response = self.client.put(
+            "/app/states/upsert/",
+            [state_data("GJ", name="Gujarat", country_code="NP")],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        record = self.record("AMD")
+        self.assertEqual((record.state_name, record.country_code), ("Gujarat", "NP"))
+        self.assertSynced()
+
+    def test_parent_deletes(self):
+        response = self.client.delete(f"/app/states/{self.gujarat.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            list(CityRecord.objects.values_list("city_code", flat=True)), ["CKOC"]
+        )
+        response = self.client.delete(f"/app/countries/{self.india.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(CityRecord.objects.exists())
+
+        nepal = self.create_state(self.nepal, "BA")
+        City.objects.create(state=nepal, **city_data("KTM"))
+        self.user.delete()
+        self.assertFalse(CityRecord.objects.exists())
+
+
+class QueriesScriptTests(TestCase):
+    """
+    ``app/scripts/queries.py`` runs against the current read models
+    """
+
+    def test_population_extremes(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            queries.run()
+        cities = City.objects.filter(state__country__name="India")
+        smallest = cities.order_by("population").first()
+        largest = cities.order_by("-population").first()
+        self.assertIn(
+            f"Minimum Population: {smallest.population}\n"
+            f"City with Minimum Population: {smallest.name}\n"
+            f"Maximum Population: {largest.population}\n"
+            f"City with Maximum Population: {largest.name}\n",
+            output.getvalue(),
+        )
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from .views import (
     CountryListCreateView,
     CountryRetrieveUpdateDestroyView,
@@ -6,6 +6,17 @@ from .views import (
     StateRetrieveUpdateDestroyView,
     CityListCreateView,
     CityRetrieveUpdateDestroyView,
+    CityIngestView,
+    CityUpsertView,
+    StateUpsertView,
+    CityBatchRetrieveView,
+    StateBatchRetrieveView,
+    ImportJobRetrieveView,
+    GeoExportView,
+    CountryDemographicsView,
+    CityRankingView,
+    CityAutocompleteView,
+    StateDemographicsView,
     Home,
 )
 
@@ -17,14 +28,41 @@ urlpatterns = [
         CountryRetrieveUpdateDestroyView.as_view(),
         name="country-detail",
     ),
+    path(
+        "countries/<uuid:pk>/demographics/",
+        CountryDemographicsView.as_view(),
+        name="country-demographics",
+    ),
+    path("states/upsert/", StateUpsertView.as_view(), name="state-upsert"),
+    path("states/batch/", StateBatchRetrieveView.as_view(), name="state-batch"),
     path("states/", StateListCreateView.as_view(), name="state-list-create"),
     path(
         "states/<uuid:pk>/",
         StateRetrieveUpdateDestroyView.as_view(),
         name="state-detail",
     ),
+    path(
+        "states/<uuid:pk>/demographics/",
+        StateDemographicsView.as_view(),
+        name="state-demographics",
+    ),
+    path("cities/rankings/", CityRankingView.as_view(), name="city-rankings"),
+    path(
+        "cities/autocomplete/",
+        CityAutocompleteView.as_view(),
+        name="city-autocomplete",
+    ),
+    path("cities/upsert/", CityUpsertView.as_view(), name="city-upsert"),
+    path("cities/batch/", CityBatchRetrieveView.as_view(), name="city-batch"),
+    path("cities/ingest/", CityIngestView.as_view(), name="city-ingest"),
     path("cities/", CityListCreateView.as_view(), name="city-list-create"),
     path(
         "cities/<uuid:pk>/", CityRetrieveUpdateDestroyView.as_view(), name="city-detail"
     ),
+    re_path(
+        r"^export/(?P<kind>countries|states|cities)\.(?P<fmt>csv|jsonl)$",
+        GeoExportView.as_view(),
+        name="geo-export",
+    ),
+    path("jobs/<uuid:pk>/", ImportJobRetrieveView.as_view(), name="import-job-detail"),
 ]
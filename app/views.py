@@ -1,32 +1,65 @@
-from django.shortcuts import render
-from django.http import HttpResponse
-import jwt, datetime
+from django.shortcuts import get_object_or_404, render
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db.models import Count, Max, Sum, Value
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+import hashlib
+import json
+from collections import Counter
 
 # REST Framework imports
 from rest_framework import viewsets
 from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.token_blacklist.models import (
-    OutstandingToken,
-    BlacklistedToken,
-)
+
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.utils.encoders import JSONEncoder
 
 # Local imports
-from exercise1 import settings
-from .models import CustomUser, Country, State, City
+from .models import (
+    CustomUser,
+    Country,
+    State,
+    City,
+    CityRecord,
+    ImportJob,
+    CountryDemographics,
+    StateDemographics,
+)
 from .serializers import (
     CustomUserSerializer,
     CountrySerializer,
     StateSerializer,
     CitySerializer,
+    ImportJobSerializer,
+    CountryDemographicsSerializer,
+    StateDemographicsSerializer,
+    BatchLookupSerializer,
+)
+from .authentication import CachedJWTAuthentication
+from .filters import RangeFilter
+from .pagination import ModelPagination, estimate_count
+from .ingest import GeoIngest
+from .parsers import NDJSONParser
+from . import (
+    analytics,
+    authentication,
+    autocomplete,
+    cache,
+    export,
+    fieldsets,
+    filters,
+    jobs,
+    readers,
+    revocation,
 )
-from .pagination import ModelPagination
 
 
 class RegisterView(APIView):
@@ -41,7 +74,7 @@ class RegisterView(APIView):
 
 
 class Home(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -80,44 +113,195 @@ class LoginView(APIView):
 
 
 class LogoutView(APIView):
-    authentication_classes = [JWTAuthentication]
+    """
+    Revoke the request's access token and, when given, its refresh token
+
+    The refresh token is read from a ``refresh`` field of the request body.
+    Revoked tokens fail authentication in every process from then on, see
+    ``revocation.py``.
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        try:
-            # Extract the access token from the Authorization header
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or not auth_header.startswith("Bearer "):
-                raise AuthenticationFailed("Authorization header missing or invalid")
+        return self.logout(request)
 
-            access_token = auth_header.split(" ")[1]
+    def post(self, request):
+        return self.logout(request)
 
-            # Decode the access token to get the user ID
-            decoded_token = jwt.decode(
-                access_token, settings.SECRET_KEY, algorithms=["HS256"]
-            )
-            user_id = decoded_token.get("user_id")
-
-            # Get the refresh token for the user
-            user = CustomUser.objects.get(id=user_id)
-            refresh_token = RefreshToken.for_user(user)
-
-            # Blacklist the refresh token
-            refresh_token_obj = OutstandingToken.objects.get(token=str(refresh_token))
-            BlacklistedToken.objects.create(token=refresh_token_obj)
-
-            # Invalidate the access token by adding it to a blacklist or setting its expiration
-            # Here, we will just delete the cookie and rely on the token expiration
-            response = Response()
-            response.delete_cookie("jwt")
-            response.data = {"message": "success"}
-            return response
-        except OutstandingToken.DoesNotExist:
+    def logout(self, request):
+        tokens = [request.auth]
+        if not isinstance(request.data, dict):
             return Response(
-                {"error": "Token does not exist"}, status=status.HTTP_400_BAD_REQUEST
+                {"error": "Expected an object with an optional refresh token"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        raw_refresh = request.data.get("refresh")
+        if raw_refresh:
+            try:
+                refresh = RefreshToken(raw_refresh)
+            except TokenError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            user_id_claim = jwt_settings.USER_ID_CLAIM
+            if refresh.get(user_id_claim) != request.auth.get(user_id_claim):
+                return Response(
+                    {"error": "Refresh token belongs to another user"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            # Also honoured by simplejwt's own refresh view
+            refresh.blacklist()
+            tokens.append(refresh)
+        revocation.revoke(tokens, request.user)
+
+        response = Response()
+        response.delete_cookie("jwt")
+        response.data = {"message": "success"}
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET with 304 Not Modified when the client's copy is current
+
+    Views list the querysets their response is built from in
+    ``get_validator_querysets``. The ETag and Last-Modified validators come
+    from a single count/max(updated_at) query over all of them and are kept
+    in the geo cache until the next write, so a 304 costs no serialization.
+    Responses also embed owner emails, which have no timestamp, so the ETag
+    includes the user version that every user write bumps. Row deletions and
+    user changes only show in the ETag, so clients should prefer
+    If-None-Match over If-Modified-Since.
+    """
+
+    def get_validator_querysets(self):
+        """
+        Querysets whose rows the response is built from; by default the rows
+        of the view itself
+        """
+        queryset = self.get_base_queryset()
+        if "pk" in self.kwargs:
+            queryset = queryset.filter(pk=self.kwargs["pk"])
+        return [queryset]
+
+    def get_validators(self):
+        key = f"{cache.response_key(self.request)}:validators"
+        validators = cache.get_response(key)
+        if validators is None:
+            validators = self.compute_validators()
+            cache.set_response(key, validators)
+        return validators
+
+    def compute_validators(self):
+        stats = [
+            queryset.order_by()
+            .values(position=Value(position))
+            .annotate(count=Count("pk"), last_modified=Max("updated_at"))
+            .values_list("position", "count", "last_modified")
+            for position, queryset in enumerate(self.get_validator_querysets())
+        ]
+        rows = sorted(stats[0].union(*stats[1:], all=True))
+        if self.kwargs and not rows[0][1]:
+            # The detail view is about to 404, there is nothing to validate
+            return None, None
+        parts = [
+            str(self.request.user.pk),
+            self.request.get_full_path(),
+            str(cache.get_version(authentication.VERSION_KEY)),
+        ]
+        parts += [f"{count}:{last_modified}" for _, count, last_modified in rows]
+        etag = quote_etag(hashlib.md5(";".join(parts).encode()).hexdigest())
+        timestamps = [last_modified for _, _, last_modified in rows if last_modified]
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+        return etag, last_modified
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = None
+        if etag is not None:
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if etag is not None and response.status_code in (
+            status.HTTP_200_OK,
+            status.HTTP_304_NOT_MODIFIED,
+        ):
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+        return response
+
+
+class FieldsetMixin:
+    """
+    Apply ``?fields=`` / ``?expand=`` to GET responses and their queryset
+    """
+
+    def get_fieldset(self):
+        if self.request.method != "GET":
+            return None
+        return fieldsets.parse(
+            self.request.query_params.get("fields"),
+            self.request.query_params.get("expand"),
+        )
+
+    def get_base_queryset(self):
+        """
+        Rows before eager loading; every row of the serializer's model unless
+        overridden
+        """
+        return self.get_serializer_class().Meta.model.objects.all()
+
+    def get_queryset(self):  # type: ignore
+        return self.serializer_class.setup_eager_loading(
+            self.get_base_queryset(), self.get_fieldset()
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fieldset"] = self.get_fieldset()
+        return context
+
+
+class ValuesListMixin:
+    """
+    Render list pages from values() rows instead of serializer instances
+
+    The output is identical to the serializer's, see ``readers.Reader``.
+    """
+
+    def list(self, request, *args, **kwargs):
+        reader = readers.Reader(self.get_serializer())
+        ordering = getattr(self.paginator, "ordering", None) or ()
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        # The cursor paginator reads its position from the rows
+        rows = reader.values(
+            self.filter_queryset(self.get_base_queryset()),
+            *[field.lstrip("-") for field in ordering],
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(reader.render(page))
+        return Response(reader.render(rows))
+
+
+class CachedGetMixin:
+    """
+    Serve GET responses from the geo response cache
+    """
+
+    def get(self, request, *args, **kwargs):
+        key = cache.response_key(request)
+        data = cache.get_response(key)
+        if data is not None:
+            return Response(data)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set_response(key, response.data)
+        return response
 
 
 class CustomUserListCreateView(generics.ListCreateAPIView):
@@ -130,68 +314,45 @@ class CustomUserRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView)
     serializer_class = CustomUserSerializer
 
 
-class CountryListCreateView(generics.ListCreateAPIView):
-    authentication_classes = [JWTAuthentication]
+class CountryListCreateView(
+    ConditionalGetMixin,
+    CachedGetMixin,
+    ValuesListMixin,
+    FieldsetMixin,
+    generics.ListCreateAPIView,
+):
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = ModelPagination
     serializer_class = CountrySerializer
 
-    def get_queryset(self):  # type: ignore
-        return Country.objects.prefetch_related("states").filter(
-            my_user=self.request.user
-        )
+    def get_base_queryset(self):
+        return Country.objects.filter(my_user=self.request.user)
+
+    def get_validator_querysets(self):
+        user = self.request.user
+        return [
+            Country.objects.filter(my_user=user),
+            State.objects.filter(country__my_user=user),
+            CityRecord.objects.filter(owner=user),
+        ]
 
     def create(self, request, *args, **kwargs):
         is_many = isinstance(
             request.data, list
         )  # Check if input is a list of countries
+        countries_data = request.data if is_many else [request.data]
 
-        if is_many:
-            countries_data = request.data
-        else:
-            countries_data = [
-                request.data
-            ]  # Wrap single dictionary in a list for uniform processing
-
-        created_countries = []  # To store created countries, their states, and cities
-
-        for country_data in countries_data:
-            states_data = country_data.pop(
-                "states", []
-            )  # Extract and remove states data from the country
-            country_serializer = self.get_serializer(data=country_data)
-            country_serializer.is_valid(raise_exception=True)
-            country = country_serializer.save()  # Save the country
-
-            created_states = []  # To store states created for this country
-
-            # Process the states
-            for state_data in states_data:
-                cities_data = state_data.pop(
-                    "cities", []
-                )  # Extract and remove cities data from the state
-                state_data["country"] = country.id  # Assign the country ID to the state
-                state_serializer = StateSerializer(data=state_data)
-                state_serializer.is_valid(raise_exception=True)
-                state = state_serializer.save()  # Save the state
-
-                # Process the cities
-                for city_data in cities_data:
-                    city_data["state"] = state.id  # Assign the state ID to the city
-                    city_serializer = CitySerializer(data=city_data)
-                    city_serializer.is_valid(raise_exception=True)
-                    city_serializer.save()
-
-                created_states.append(
-                    state_serializer.data
-                )  # Append the serialized state data
-
-            # Add states to the country response data
-            country_data_with_states = country_serializer.data
-            country_data_with_states["states"] = created_states
-            created_countries.append(
-                country_data_with_states
-            )  # Append the country data with states
+        if request.query_params.get("async") in ("1", "true"):
+            return self.create_async(request, countries_data)
+
+        # Validate the whole tree in memory and insert it level by level
+        ingest = GeoIngest(self.get_serializer_context())
+        try:
+            created_countries = ingest.countries(countries_data, request.user)
+        except ValidationError as exc:
+            detail = exc.detail if is_many else exc.detail[0]
+            return Response(detail, status=status.HTTP_400_BAD_REQUEST)
 
         # Prepare the response
         if is_many:
@@ -199,6 +360,23 @@ class CountryListCreateView(generics.ListCreateAPIView):
         else:
             return Response(created_countries[0], status=status.HTTP_201_CREATED)
 
+    def create_async(self, request, countries_data):
+        """
+        Queue the payload as a background import job and return 202
+        """
+        job = ImportJob.objects.create(
+            my_user=request.user,
+            payload=countries_data,
+            total_rows=len(countries_data),
+        )
+        jobs.enqueue(job)
+        location = reverse("import-job-detail", kwargs={"pk": job.pk}, request=request)
+        return Response(
+            ImportJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": location},
+        )
+
     def perform_create(self, serializer):
         try:
             if serializer.is_valid(raise_exception=True):
@@ -209,11 +387,23 @@ class CountryListCreateView(generics.ListCreateAPIView):
             return Response("Exception: " + str(e), status=status.HTTP_400_BAD_REQUEST)
 
 
-class CountryRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class CountryRetrieveUpdateDestroyView(
+    ConditionalGetMixin,
+    CachedGetMixin,
+    FieldsetMixin,
+    generics.RetrieveUpdateDestroyAPIView,
+):
     serializer_class = CountrySerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
-    queryset = Country.objects.prefetch_related("states")
+
+    def get_validator_querysets(self):
+        pk = self.kwargs["pk"]
+        return [
+            Country.objects.filter(pk=pk),
+            State.objects.filter(country_id=pk),
+            CityRecord.objects.filter(country_id=pk),
+        ]
 
     def perform_update(self, serializer):
         try:
@@ -228,45 +418,28 @@ class CountryRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return super().perform_destroy(instance)
 
 
-class StateListCreateView(generics.ListCreateAPIView):
+class StateListCreateView(
+    ConditionalGetMixin, ValuesListMixin, FieldsetMixin, generics.ListCreateAPIView
+):
     serializer_class = StateSerializer
     pagination_class = ModelPagination
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def get_queryset(self):  # type: ignore
-        return State.objects.prefetch_related("cities").all()
+    def get_validator_querysets(self):
+        return [State.objects.all(), City.objects.all(), Country.objects.all()]
 
     def create(self, request, *args, **kwargs):
         is_many = isinstance(request.data, list)  # Check if the input is a list
+        states_data = request.data if is_many else [request.data]
 
-        if is_many:
-            states_data = request.data
-        else:
-            states_data = [
-                request.data
-            ]  # Wrap single dictionary in a list for uniform processing
-
-        created_states = []  # To store created states and their cities
-
-        for state_data in states_data:
-            cities_data = state_data.pop(
-                "cities", []
-            )  # Extract and remove cities data from the state
-            state_serializer = self.get_serializer(data=state_data)
-            state_serializer.is_valid(raise_exception=True)
-            state = state_serializer.save()  # Save the state
-
-            # Process the cities
-            for city_data in cities_data:
-                city_data["state"] = state.id  # Assign the state ID to the city
-                city_serializer = CitySerializer(data=city_data)
-                city_serializer.is_valid(raise_exception=True)
-                city_serializer.save()
-
-            created_states.append(
-                state_serializer.data
-            )  # Append the serialized state data
+        # Validate the whole tree in memory and insert it level by level
+        ingest = GeoIngest(self.get_serializer_context())
+        try:
+            created_states = ingest.states(states_data)
+        except ValidationError as exc:
+            detail = exc.detail if is_many else exc.detail[0]
+            return Response(detail, status=status.HTTP_400_BAD_REQUEST)
 
         # Prepare the response
         if is_many:
@@ -284,11 +457,20 @@ class StateListCreateView(generics.ListCreateAPIView):
             return Response("Exception: " + str(e), status=status.HTTP_400_BAD_REQUEST)
 
 
-class StateRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class StateRetrieveUpdateDestroyView(
+    ConditionalGetMixin, FieldsetMixin, generics.RetrieveUpdateDestroyAPIView
+):
     serializer_class = StateSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
-    queryset = State.objects.prefetch_related("cities").all()
+
+    def get_validator_querysets(self):
+        pk = self.kwargs["pk"]
+        return [
+            State.objects.filter(pk=pk),
+            City.objects.filter(state_id=pk),
+            Country.objects.filter(states=pk),
+        ]
 
     def perform_update(self, serializer):
         try:
@@ -303,15 +485,52 @@ class StateRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return super().perform_destroy(instance)
 
 
-class CityListCreateView(generics.ListCreateAPIView):
+class CityListCreateView(
+    ConditionalGetMixin, ValuesListMixin, FieldsetMixin, generics.ListCreateAPIView
+):
     serializer_class = CitySerializer
     pagination_class = ModelPagination
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
-
-    def get_queryset(self):  # type: ignore
+    filter_backends = [RangeFilter]
+    filter_model = CityRecord
+    filter_fields = {
+        "state": "state",
+        "country": "country",
+        "population": "population",
+        "avg_age": "avg_age",
+        "num_of_adult_males": "num_of_adult_males",
+        "num_of_adult_females": "num_of_adult_females",
+    }
+
+    def get_base_queryset(self):
+        if self.request.method == "GET":
+            # Lists read the flat records, so filters need no joins
+            return CityRecord.objects.all()
         return City.objects.all()
 
+    def get_validator_querysets(self):
+        return [City.objects.all()]
+
+    def estimate_count(self, queryset):
+        """
+        Exact counts of a whole state, country or table from the demographic
+        rollups, estimates for anything narrower
+        """
+        lookups = filters.parse(
+            self.request.query_params, self.filter_model, self.filter_fields
+        )
+        if not lookups:
+            rollups = CountryDemographics.objects.all()
+        elif list(lookups) == ["state"]:
+            rollups = StateDemographics.objects.filter(state_id=lookups["state"])
+        elif list(lookups) == ["country"]:
+            rollups = CountryDemographics.objects.filter(country_id=lookups["country"])
+        else:
+            return estimate_count(queryset)
+        count = rollups.aggregate(count=Sum("city_count"))["count"]
+        return count or 0, True
+
     def create(self, request, *args, **kwargs):
         is_many = isinstance(request.data, list)
         serializer = self.get_serializer(data=request.data, many=is_many)
@@ -332,11 +551,12 @@ class CityListCreateView(generics.ListCreateAPIView):
             return Response("Exception: " + str(e), status=status.HTTP_400_BAD_REQUEST)
 
 
-class CityRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class CityRetrieveUpdateDestroyView(
+    ConditionalGetMixin, FieldsetMixin, generics.RetrieveUpdateDestroyAPIView
+):
     serializer_class = CitySerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
-    queryset = City.objects.all()
 
     def perform_update(self, serializer):
         try:
@@ -349,3 +569,325 @@ class CityRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
 
     def perform_destroy(self, instance):
         return super().perform_destroy(instance)
+
+
+class CityIngestView(APIView):
+    """
+    Stream an NDJSON feed of cities into the database in fixed-size chunks
+
+    Each line is one city payload. The response is NDJSON as well, with one
+    result per input line followed by a summary line.
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [NDJSONParser]
+    chunk_size = 500
+
+    def post(self, request):
+        lines = request.data  # Lazy iterator over the request stream
+        ingest = GeoIngest({"request": request, "view": self})
+        return StreamingHttpResponse(
+            self.stream_results(ingest, lines), content_type=NDJSONParser.media_type
+        )
+
+    def stream_results(self, ingest, lines):
+        totals = {"created": 0, "failed": 0}
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= self.chunk_size:
+                yield from self.ingest_chunk(ingest, chunk, totals)
+                chunk = []
+        if chunk:
+            yield from self.ingest_chunk(ingest, chunk, totals)
+        yield self.encode({"summary": totals})
+
+    def ingest_chunk(self, ingest, chunk, totals):
+        rows = [row for _, row, error in chunk if error is None]
+        instances, errors = ingest.cities_chunk(rows)
+        results = iter(zip(instances, errors))
+        for line_number, _, parse_error in chunk:
+            if parse_error is not None:
+                result = {"line": line_number, "errors": [parse_error]}
+            else:
+                instance, error = next(results)
+                if error:
+                    result = {"line": line_number, "errors": error}
+                else:
+                    result = {"line": line_number, "id": instance.id}
+            totals["failed" if "errors" in result else "created"] += 1
+            yield self.encode(result)
+
+    def encode(self, data):
+        return json.dumps(data, cls=JSONEncoder) + "\n"
+
+
+class GeoExportView(APIView):
+    """
+    Stream every country, state or city of the user as CSV or JSON Lines
+
+    ``?country_code=`` limits the export to one country.
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    content_types = {"csv": "text/csv", "jsonl": NDJSONParser.media_type}
+
+    def get(self, request, kind, fmt):
+        header, rows = export.export_rows(
+            kind,
+            user=request.user,
+            country_code=request.query_params.get("country_code"),
+        )
+        response = StreamingHttpResponse(
+            export.encode(fmt, header, rows), content_type=self.content_types[fmt]
+        )
+        response["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+        return response
+
+
+class ImportJobRetrieveView(generics.RetrieveAPIView):
+    serializer_class = ImportJobSerializer
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):  # type: ignore
+        return ImportJob.objects.filter(my_user=self.request.user)
+
+
+class CityRankingView(APIView):
+    """
+    Min, max and top-N cities by population or avg_age per country or state
+
+    Query parameters: ``group`` (country or state), ``metric`` (population or
+    avg_age) and ``top`` (1 to 100).
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        group = request.query_params.get("group", "country")
+        metric = request.query_params.get("metric", "population")
+        errors = {}
+        if group not in analytics.GROUPS:
+            errors["group"] = [f"Choose one of {', '.join(analytics.GROUPS)}."]
+        if metric not in analytics.METRICS:
+            errors["metric"] = [f"Choose one of {', '.join(analytics.METRICS)}."]
+        try:
+            top = int(request.query_params.get("top", 3))
+        except ValueError:
+            top = 0
+        if not 1 <= top <= analytics.MAX_TOP:
+            errors["top"] = [f"Must be an integer from 1 to {analytics.MAX_TOP}."]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        cities = CityRecord.objects.filter(owner=request.user)
+        return Response(
+            {
+                "group": group,
+                "metric": metric,
+                "top": top,
+                "results": analytics.city_rankings(cities, group, metric, top),
+            }
+        )
+
+
+class CityAutocompleteView(APIView):
+    """
+    Countries, states and cities of the user whose name starts with a prefix
+
+    Query parameters: ``q`` (the prefix, any case and accents) and ``limit``
+    (1 to 50). Served from the in-memory index in ``autocomplete.py``.
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        errors = {}
+        if not autocomplete.fold(query):
+            errors["q"] = ["This parameter is required."]
+        try:
+            limit = int(request.query_params.get("limit", autocomplete.DEFAULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= autocomplete.MAX_LIMIT:
+            errors["limit"] = [
+                f"Must be an integer from 1 to {autocomplete.MAX_LIMIT}."
+            ]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "query": query,
+                "results": autocomplete.search(request.user, query, limit),
+            }
+        )
+
+
+class DemographicsRetrieveView(generics.RetrieveAPIView):
+    """
+    Stored city totals of a country or state, read by primary key
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    parent_model = None
+
+    def get_object(self):
+        model = self.serializer_class.Meta.model
+        try:
+            return model.objects.get(pk=self.kwargs["pk"])
+        except model.DoesNotExist:
+            # No rollup row until the first city is added
+            parent = get_object_or_404(self.parent_model, pk=self.kwargs["pk"])
+            return self.empty_rollup(parent)
+
+
+class CountryDemographicsView(DemographicsRetrieveView):
+    serializer_class = CountryDemographicsSerializer
+    parent_model = Country
+
+    def empty_rollup(self, country):
+        return CountryDemographics(country=country)
+
+
+class StateDemographicsView(DemographicsRetrieveView):
+    serializer_class = StateDemographicsSerializer
+    parent_model = State
+
+    def empty_rollup(self, state):
+        return StateDemographics(state=state, country_id=state.country_id)
+
+
+class BulkUpsertView(APIView):
+    """
+    Insert or update many rows in one request, matching on a natural key
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    model = None
+    serializer_class = None
+    key = None
+    parent_model = None
+    parent_field = None
+
+    def put(self, request):
+        rows = request.data if isinstance(request.data, list) else [request.data]
+        ingest = GeoIngest({"request": request, "view": self})
+        try:
+            instances, statuses = ingest.upsert(
+                self.model,
+                self.serializer_class,
+                rows,
+                self.key,
+                self.parent_model,
+                self.parent_field,
+            )
+        except ValidationError as exc:
+            return Response(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        counts = Counter(statuses)
+        return Response(
+            {
+                "created": counts["created"],
+                "updated": counts["updated"],
+                "unchanged": counts["unchanged"],
+                "results": [
+                    {
+                        "id": instance.pk,
+                        self.key: getattr(instance, self.key),
+                        "status": row_status,
+                    }
+                    for instance, row_status in zip(instances, statuses)
+                ],
+            }
+        )
+
+
+class BatchRetrieveView(APIView):
+    """
+    Read many rows by primary key or natural key in one request
+
+    POST ``{"ids": [...]}`` or ``{"codes": [...]}``, or GET with either as a
+    comma separated query parameter. Results come in request order, with a
+    not-found marker in place of each missing row. Rows are rendered like the
+    list pages, with one ``IN`` query per model and ``?fields=``/``?expand=``.
+    """
+
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = None
+    key = None
+
+    def get(self, request):
+        data = {
+            name: request.query_params[name].split(",")
+            for name in ("ids", "codes")
+            if name in request.query_params
+        }
+        return self.retrieve(request, data)
+
+    def post(self, request):
+        return self.retrieve(request, request.data)
+
+    def retrieve(self, request, data):
+        lookup = BatchLookupSerializer(data=data)
+        if not lookup.is_valid():
+            return Response(lookup.errors, status=status.HTTP_400_BAD_REQUEST)
+        if "ids" in lookup.validated_data:
+            name, field, values = "id", "pk", lookup.validated_data["ids"]
+        else:
+            name, field, values = self.key, self.key, lookup.validated_data["codes"]
+
+        fieldset = fieldsets.parse(
+            request.query_params.get("fields"), request.query_params.get("expand")
+        )
+        context = {"request": request, "view": self, "fieldset": fieldset}
+        reader = readers.Reader(self.serializer_class(context=context))
+        model = self.serializer_class.Meta.model
+        queryset = model.objects.filter(**{f"{field}__in": set(values)})
+        extra = [] if field == "pk" else [field]
+        rows = list(reader.values(queryset, *extra))
+        found = {row[field]: item for row, item in zip(rows, reader.render(rows))}
+        missing = str(NotFound.default_detail)
+        return Response(
+            {
+                "results": [
+                    found[value] if value in found else {name: value, "detail": missing}
+                    for value in values
+                ]
+            }
+        )
+
+
+class CityBatchRetrieveView(BatchRetrieveView):
+    serializer_class = CitySerializer
+    key = "city_code"
+
+
+class StateBatchRetrieveView(BatchRetrieveView):
+    serializer_class = StateSerializer
+    key = "gst_code"
+
+
+class CityUpsertView(BulkUpsertView):
+    model = City
+    serializer_class = CitySerializer
+    key = "city_code"
+    parent_model = State
+    parent_field = "state"
+
+
+class StateUpsertView(BulkUpsertView):
+    model = State
+    serializer_class = StateSerializer
+    key = "gst_code"
+    parent_model = Country
+    parent_field = "country"
@@ -103,6 +103,22 @@ DATABASES = {
     }
 }
 
+# Use a shared backend (Redis, Memcached) in production so all workers see
+# the same geo data version
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Cached geo responses (see app/cache.py)
+GEO_CACHE_TIMEOUT = 300
+GEO_CACHE_LRU_SIZE = 256
+
+# Validated access tokens and users kept per process (see app/authentication.py)
+AUTH_TOKEN_CACHE_SIZE = 10_000
+AUTH_USER_CACHE_SIZE = 10_000
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -149,9 +165,7 @@ AUTH_USER_MODEL = "app.CustomUser"
 
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("app.authentication.CachedJWTAuthentication",),
 }
 
 SIMPLE_JWT = {
@@ -165,7 +179,8 @@ SIMPLE_JWT = {
     "ISSUER": None,
     "USER_ID_FIELD": "id",
     "USER_ID_CLAIM": "user_id",
-    "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
+    # Access tokens revoked by logout fail authentication (app/revocation.py)
+    "AUTH_TOKEN_CLASSES": ("app.revocation.RevocableAccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
     "JTI_CLAIM": "jti",
     "SLIDING_TOKEN_REFRESH_EXP_CLAIM": "refresh_exp",
@@ -179,7 +194,7 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     # Authentication
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "app.authentication.CachedJWTAuthentication",
     ],
     # Permissions
     "DEFAULT_PERMISSION_CLASSES": [
@@ -193,7 +208,20 @@ REST_FRAMEWORK = {
     "DEFAULT_THROTTLE_RATES": {"anon": "100/day", "user": "100/min"},
 }
 
+# Background import jobs (?async=true on /app/countries/)
+IMPORT_JOB_WORKERS = 2
+# Seconds without progress after which a running job counts as abandoned
+IMPORT_JOB_TIMEOUT = 600
+
 SILKY_PYTHON_PROFILER = True
+# Silk reads whole request and response bodies, which defeats streaming, and
+# writes several rows per request, which dwarfs an autocomplete lookup
+SILKY_IGNORE_PATHS = ["/app/cities/ingest/", "/app/cities/autocomplete/"]
+SILKY_IGNORE_PATHS += [
+    f"/app/export/{kind}.{fmt}"
+    for kind in ["countries", "states", "cities"]
+    for fmt in ["csv", "jsonl"]
+]
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "World App",